@@ -1,6 +1,10 @@
+from contextlib import contextmanager
 from datetime import datetime
 import time
-from app.wb_monitor import check
+from app.scheduler import AdaptiveScheduler
+from app.shard import ShardCoordinator
+from app.utils import metrics
+from app.wb_monitor import Monitor
 
 
 def sleep_until_next_period(period_seconds):
@@ -11,14 +15,107 @@ def sleep_until_next_period(period_seconds):
     print(f'sleep {sleep_duration} s')
     time.sleep(sleep_duration)
 
-if __name__ == "__main__":
-    period_seconds = 600  # 定义周期长度
 
+def assigned_users(monitor, coordinator):
+    """本 worker 负责的用户：未开启分片时为全部用户。"""
+    if coordinator is None:
+        return monitor.user_ids
+    return coordinator.filter_users(monitor.user_ids)
+
+
+@contextmanager
+def holding(coordinator, user_ids):
+    """
+    在 with 块内占用这些用户所在分片的租约，产出本 worker 负责的用户。
+
+    一轮 check() 进行期间分片不会交给其他 worker，避免同一条博文被两个 worker 推送。
+    """
+    if coordinator is None:
+        yield user_ids
+        return
+    with coordinator.hold(user_ids) as held:
+        yield held
+
+
+def run_fixed(monitor, period_seconds, coordinator=None):
+    """所有用户按固定周期统一轮询。"""
     while True:
         try:
-            check()
+            with holding(coordinator, monitor.user_ids) as user_ids:
+                monitor.check(user_ids)
             sleep_until_next_period(period_seconds)
         except Exception as e:
             print(f"执行main函数时发生异常：{e}")
             # 可选：在此处进行一些恢复或清理工作
             continue
+
+
+def run_adaptive(monitor, scheduler, coordinator=None, max_sleep=5):
+    """按调度器为每个用户单独计算的间隔轮询。"""
+    while True:
+        # 配置热更新后新增的用户、修改的优先级在下一次循环生效
+        scheduler.priorities = {
+            str(k): v
+            for k, v in monitor.config.get("scheduler", {}).get("priorities", {}).items()
+        }
+        scheduler.set_users(assigned_users(monitor, coordinator))
+        due_user_ids = scheduler.pop_due()
+        if due_user_ids:
+            results = {}
+            try:
+                with holding(coordinator, due_user_ids) as user_ids:
+                    results = monitor.check(user_ids)
+            except Exception as e:
+                print(f"执行main函数时发生异常：{e}")
+            # 已弹出的用户必须重新入堆，异常时按失败退避
+            for user_id in due_user_ids:
+                if user_id in monitor.carried_over:
+                    # 超过本轮时限未抓取，下一次循环优先处理
+                    scheduler.requeue(user_id)
+                    continue
+                posts = results.get(user_id)
+                scheduler.report(
+                    user_id,
+                    [post.created_at for post in posts or []],
+                    ok=posts is not None,
+                )
+        time.sleep(min(max(1.0, scheduler.seconds_until_next()), max_sleep))
+
+
+if __name__ == "__main__":
+    period_seconds = 600  # 定义周期长度
+    monitor = Monitor("config.yml")
+    config = monitor.config
+    reload_interval = config.get("reload", {}).get("interval", 5)
+    if reload_interval:
+        # 后台检测 config.yml 的修改，用户列表和飞书凭据无需重启即可生效
+        monitor.start_watching(reload_interval)
+    scheduler_config = config.get("scheduler", {})
+    metrics_config = config.get("metrics", {})
+
+    if metrics_config.get("enabled", False):
+        # 本地 Prometheus 指标端点：http://host:port/metrics
+        metrics.start_http_server(
+            metrics_config.get("port", 9108), metrics_config.get("host", "127.0.0.1")
+        )
+
+    coordinator = None
+    if config.get("shard", {}).get("enabled", False):
+        # 多 worker 分片：各 worker 通过共享的租约库划分用户
+        coordinator = ShardCoordinator.from_config(config["shard"])
+        coordinator.start()
+        monitor.coordinator = coordinator
+
+    try:
+        if scheduler_config.get("enabled", False):
+            run_adaptive(
+                monitor,
+                AdaptiveScheduler.from_config(scheduler_config),
+                coordinator,
+                max_sleep=reload_interval or 60,
+            )
+        else:
+            run_fixed(monitor, period_seconds, coordinator)
+    finally:
+        if coordinator is not None:
+            coordinator.stop()
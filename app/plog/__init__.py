@@ -3,26 +3,33 @@ from app.utils.lark_boot_webhook_msg import LarkBot
 from .logger import setup_logger
 import logging
 
-# 设置一个默认的全局日志器
-_default_logger = setup_logger()
+# 默认的全局日志器，首次使用时才创建，导入时不生成日志文件
+_default_logger = None
+
+
+def get_default_logger():
+    global _default_logger
+    if _default_logger is None:
+        _default_logger = setup_logger()
+    return _default_logger
 
 
 # 定义简易接口
 def debug(message):
-    _default_logger.debug(message)
+    get_default_logger().debug(message)
 
 
 def info(message):
-    _default_logger.info(message)
+    get_default_logger().info(message)
 
 
 def warning(message):
-    _default_logger.warning(message)
+    get_default_logger().warning(message)
 
 
 def error(message):
-    _default_logger.error(message)
+    get_default_logger().error(message)
 
 
 def critical(message):
-    _default_logger.critical(message)
+    get_default_logger().critical(message)
@@ -1,13 +1,81 @@
 # plog/handlers.py
 
 import logging
+import threading
+
 
 class LarkLogHandler(logging.Handler):
-    def __init__(self, bot, level=logging.WARNING):
+    """
+    把告警日志推送到飞书的处理器。
+
+    emit 只把记录放进缓冲区，后台线程每 window 秒把窗口内的告警合并成一条
+    消息发送：内容相同的告警只保留一条并附带次数，单个窗口最多 max_alerts 种，
+    超出部分只计数。错误刷屏时既不会阻塞调用方，也不会触发 Webhook 限流。
+    """
+
+    def __init__(self, bot, level=logging.WARNING, window=60, max_alerts=20):
         super().__init__(level)
         self.bot = bot
+        self.window = window
+        self.max_alerts = max_alerts
+        self._buffer = {}
+        self._dropped = 0
+        self._buffer_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._worker = threading.Thread(target=self._run, name="lark-log-alert", daemon=True)
+        self._worker.start()
 
     def emit(self, record):
-        if record.levelno >= self.level:
+        if record.levelno < self.level:
+            return
+        try:
             log_entry = self.format(record)
-            self.bot.sendmsg(f"Alert from {record.name}", log_entry)
+        except Exception:
+            self.handleError(record)
+            return
+        # 按级别、位置和消息内容去重
+        key = (record.levelname, record.pathname, record.lineno, record.getMessage())
+        with self._buffer_lock:
+            alert = self._buffer.get(key)
+            if alert is not None:
+                alert[1] += 1
+            elif len(self._buffer) < self.max_alerts:
+                self._buffer[key] = [log_entry, 1]
+            else:
+                self._dropped += 1
+
+    def _take(self):
+        with self._buffer_lock:
+            alerts = list(self._buffer.values())
+            dropped = self._dropped
+            self._buffer = {}
+            self._dropped = 0
+        return alerts, dropped
+
+    def flush(self):
+        alerts, dropped = self._take()
+        if not alerts:
+            return
+        lines = [
+            entry if count == 1 else f"{entry}  (×{count})" for entry, count in alerts
+        ]
+        if dropped:
+            lines.append(f"另有 {dropped} 条告警未展示")
+        total = sum(count for _, count in alerts) + dropped
+        self.bot.send_msg(f"Alert: {total} 条告警", "\n".join(lines))
+
+    def _run(self):
+        while not self._closed.wait(self.window):
+            try:
+                self.flush()
+            except Exception:
+                # 告警发送失败不能影响业务线程
+                pass
+
+    def close(self):
+        self._closed.set()
+        try:
+            self.flush()
+        except Exception:
+            pass
+        super().close()
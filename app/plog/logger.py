@@ -1,6 +1,9 @@
+import atexit
+import json
 import logging
 import logging.handlers
 import os
+import queue
 import tempfile
 
 class ColoredFormatter(logging.Formatter):
@@ -14,20 +17,58 @@ class ColoredFormatter(logging.Formatter):
     }
     RESET = "\033[0m"
 
+    def __init__(self):
+        super().__init__()
+        # 每个级别的 Formatter 只创建一次
+        self._formatters = {}
+
     def format(self, record):
-        log_fmt = f"{self.COLORS.get(record.levelname, '')}%(asctime)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s{self.RESET}"
-        formatter = logging.Formatter(log_fmt, "%Y-%m-%d %H:%M:%S")
+        formatter = self._formatters.get(record.levelname)
+        if formatter is None:
+            log_fmt = f"{self.COLORS.get(record.levelname, '')}%(asctime)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s{self.RESET}"
+            formatter = logging.Formatter(log_fmt, "%Y-%m-%d %H:%M:%S")
+            self._formatters[record.levelname] = formatter
         return formatter.format(record)
 
 
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行 JSON，便于日志系统采集。"""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S%z"),
+            "level": record.levelname,
+            "logger": record.name,
+            "file": f"{record.filename}:{record.lineno}",
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
 def setup_logger(name='plog', 
                     log_file=None, 
                     level=logging.DEBUG, 
                     format='%(asctime)s [%(levelname)s] %(message)s', 
                     when='midnight',
                     interval=1, 
-                    backupCount=7):
-    """配置并获取一个日志器"""
+                    backupCount=7,
+                    async_mode=False,
+                    json_format=False,
+                    extra_handlers=None):
+    """
+    配置并获取一个日志器
+
+    async_mode 为 True 时，日志器只把记录放入队列，由后台线程写文件和控制台，
+    调用方不会被磁盘或终端 I/O 阻塞。json_format 为 True 时输出结构化 JSON。
+    extra_handlers 为额外的处理器（如 LarkLogHandler），与文件、控制台处理器一起挂在队列之后。
+    """
+    logger = logging.getLogger(name)
+    if logger.handlers:
+        # 已经配置过，避免重复添加处理器
+        return logger
+
     # 如果未提供日志文件路径，使用系统临时目录
     if log_file is None:
         temp_dir = tempfile.gettempdir()
@@ -40,28 +81,36 @@ def setup_logger(name='plog',
         
     print(f'log_file:{log_file}')
     
-    formatter = logging.Formatter(format)
-
-
     # 文件处理器
     file_handler = logging.handlers.TimedRotatingFileHandler(
         log_file, when=when, interval=interval, backupCount=backupCount)
-    file_handler.setFormatter(formatter)
 
     # 控制台处理器
     console_handler = logging.StreamHandler()
+
+    # 创建带颜色的 Formatter，或结构化 JSON Formatter
+    if json_format:
+        formatter = JsonFormatter()
+    else:
+        formatter = ColoredFormatter()
+    file_handler.setFormatter(formatter)
     console_handler.setFormatter(formatter)
 
-    # 创建带颜色的 Formatter
-    colored_formatter = ColoredFormatter()
-    file_handler.setFormatter(colored_formatter)
-    console_handler.setFormatter(colored_formatter)
+    handlers = [file_handler, console_handler] + list(extra_handlers or [])
 
     # 创建并配置日志器
-    logger = logging.getLogger(name)
     logger.setLevel(level)
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    if async_mode:
+        log_queue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(
+            log_queue, *handlers, respect_handler_level=True)
+        listener.start()
+        # 进程退出前把队列中剩余的日志写完
+        atexit.register(listener.stop)
+        logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    else:
+        for handler in handlers:
+            logger.addHandler(handler)
     logger.propagate = False
 
     return logger
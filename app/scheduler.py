@@ -0,0 +1,165 @@
+import heapq
+import random
+import statistics
+import threading
+import time
+
+# 优先级对应的轮询间隔系数，越小轮询越频繁
+PRIORITY_FACTORS = {"high": 0.25, "normal": 1.0, "low": 4.0}
+
+
+class _UserState:
+    __slots__ = ("interval", "failures", "priority", "generation", "typical_gap", "newest_post")
+
+    def __init__(self, interval, priority):
+        self.interval = interval
+        self.failures = 0
+        self.priority = priority
+        self.generation = 0
+        # 发博间隔的滑动估计，以及已观察到的最新博文时间
+        self.typical_gap = None
+        self.newest_post = None
+
+
+class AdaptiveScheduler:
+    """
+    按用户自适应轮询间隔的调度器。
+
+    以最小堆维护每个用户的下次轮询时间。每次抓取后根据博文时间戳估算
+    该用户的发博间隔：活跃用户间隔缩短，长期不发博或抓取失败的用户逐步退避，
+    所有间隔都限制在 [min_interval, max_interval] 内并加入随机抖动。
+    """
+
+    def __init__(
+        self,
+        min_interval=60,
+        max_interval=3600,
+        default_interval=600,
+        poll_fraction=0.1,
+        jitter=0.1,
+        priorities=None,
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.default_interval = default_interval
+        # 轮询间隔取估算发博间隔的多少比例
+        self.poll_fraction = poll_fraction
+        self.jitter = jitter
+        self.priorities = {str(k): v for k, v in (priorities or {}).items()}
+        self._lock = threading.Lock()
+        self._heap = []
+        self._states = {}
+
+    @classmethod
+    def from_config(cls, config):
+        """从 config.yml 的 scheduler 段创建调度器。"""
+        return cls(
+            min_interval=config.get("min_interval", 60),
+            max_interval=config.get("max_interval", 3600),
+            default_interval=config.get("default_interval", 600),
+            poll_fraction=config.get("poll_fraction", 0.1),
+            jitter=config.get("jitter", 0.1),
+            priorities=config.get("priorities", {}),
+        )
+
+    def _jittered(self, interval):
+        return interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _push(self, user_id, due_time):
+        state = self._states[user_id]
+        state.generation += 1
+        heapq.heappush(self._heap, (due_time, user_id, state.generation))
+
+    def set_users(self, user_ids, now=None):
+        """同步监控的用户列表：新用户在一个默认周期内随机分散加入，移除的用户不再调度。"""
+        now = time.time() if now is None else now
+        user_ids = {str(user_id) for user_id in user_ids}
+        with self._lock:
+            for user_id in list(self._states):
+                if user_id not in user_ids:
+                    # 堆中的旧条目在弹出时按 generation 丢弃
+                    del self._states[user_id]
+            for user_id in user_ids:
+                priority = self.priorities.get(user_id, "normal")
+                state = self._states.get(user_id)
+                if state is None:
+                    self._states[user_id] = _UserState(self.default_interval, priority)
+                    self._push(user_id, now + random.uniform(0, self.min_interval))
+                else:
+                    state.priority = priority
+
+    def pop_due(self, now=None):
+        """弹出所有已到期的用户。"""
+        now = time.time() if now is None else now
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                _, user_id, generation = heapq.heappop(self._heap)
+                state = self._states.get(user_id)
+                if state is not None and state.generation == generation:
+                    due.append(user_id)
+        return due
+
+    def requeue(self, user_id, now=None):
+        """不改变轮询间隔，把本轮未能抓取的用户重新排为立即到期。"""
+        now = time.time() if now is None else now
+        with self._lock:
+            if str(user_id) in self._states:
+                self._push(str(user_id), now)
+
+    def seconds_until_next(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            while self._heap:
+                _, user_id, generation = self._heap[0]
+                state = self._states.get(user_id)
+                if state is not None and state.generation == generation:
+                    return max(0.0, self._heap[0][0] - now)
+                heapq.heappop(self._heap)
+        return float(self.default_interval)
+
+    def _estimate_interval(self, state, timestamps, now):
+        # 增量抓取时每次只返回新博文，需要与之前观察到的最新博文时间拼接
+        timestamps = sorted(ts for ts in timestamps if ts)
+        if state.newest_post is not None:
+            timestamps = [state.newest_post] + [ts for ts in timestamps if ts > state.newest_post]
+        if not timestamps:
+            # 没有可用的时间戳（空页面或抓取异常），保持原间隔
+            return state.interval
+
+        gaps = [b - a for a, b in zip(timestamps, timestamps[1:]) if b > a]
+        if gaps:
+            gap = statistics.median(gaps)
+            # 指数滑动平均，新观察占一半权重
+            state.typical_gap = gap if state.typical_gap is None else (state.typical_gap + gap) / 2
+        state.newest_post = timestamps[-1]
+
+        typical_gap = state.typical_gap if state.typical_gap is not None else self.max_interval
+        # 距上一条博文越久，说明用户越不活跃
+        estimated_gap = max(typical_gap, now - state.newest_post)
+        factor = PRIORITY_FACTORS.get(state.priority, 1.0)
+        return estimated_gap * self.poll_fraction * factor
+
+    def report(self, user_id, timestamps=None, ok=True, now=None):
+        """
+        记录一次抓取结果并安排下次轮询。
+
+        参数：
+        - user_id: 用户ID
+        - timestamps: 本次抓取到的博文发布时间（秒级时间戳）列表
+        - ok: 抓取是否成功，失败时按指数退避
+        """
+        now = time.time() if now is None else now
+        user_id = str(user_id)
+        with self._lock:
+            state = self._states.get(user_id)
+            if state is None:
+                return
+            if ok:
+                state.failures = 0
+                interval = self._estimate_interval(state, timestamps or [], now)
+            else:
+                state.failures += 1
+                interval = state.interval * 2
+            state.interval = min(self.max_interval, max(self.min_interval, interval))
+            self._push(user_id, now + self._jittered(state.interval))
@@ -0,0 +1,197 @@
+import bisect
+import hashlib
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(str(value).encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """一致性哈希环：每个节点放置 replicas 个虚拟节点，节点增减只影响相邻区间。"""
+
+    def __init__(self, nodes, replicas=64):
+        self._ring = sorted(
+            (_hash(f"{node}#{i}"), node) for node in nodes for i in range(replicas)
+        )
+        self._keys = [key for key, _ in self._ring]
+
+    def get(self, key):
+        if not self._ring:
+            return None
+        index = bisect.bisect(self._keys, _hash(key)) % len(self._ring)
+        return self._ring[index][1]
+
+
+def shard_of(user_id, num_shards):
+    """用户所属的分片号，与 worker 数量无关，保证同一用户总落在同一分片。"""
+    return _hash(f"user:{user_id}") % num_shards
+
+
+class ShardCoordinator:
+    """
+    多 worker 分片协调。
+
+    用户先按哈希固定落到 num_shards 个分片上；存活的 worker（心跳未过期）组成
+    一致性哈希环，决定每个分片由谁负责。worker 只有持有分片租约才处理其中的
+    用户，租约按 lease_ttl 续期。worker 宕机后心跳和租约过期，它的分片被环上
+    相邻的 worker 自动接管；同一分片同一时刻只有一个持有者，共享的去重存储
+    因此不会被重复推送。
+
+    一轮 check() 通过 hold() 占用其中用户所在的分片：环变化时这些分片继续续期，
+    这一轮结束后才释放给新的负责人。续期失败或租约到期后 owns() 立即返回 False，
+    正在进行的一轮据此停止处理这些用户。
+    """
+
+    def __init__(self, path="shards.db", worker_id=None, num_shards=64, lease_ttl=60):
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.num_shards = num_shards
+        self.lease_ttl = lease_ttl
+        self._owned = frozenset()
+        # 本地认为租约有效的截止时间，与最近一次成功续期的租约同时到期
+        self._valid_until = 0.0
+        # 正在进行的 check() 占用的分片 -> 占用次数
+        self._pinned = Counter()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        # 多个进程同时写，等待锁的时间要足够长
+        self._conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS workers ("
+            " worker_id TEXT PRIMARY KEY,"
+            " heartbeat_at REAL NOT NULL"
+            ")"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS leases ("
+            " shard INTEGER PRIMARY KEY,"
+            " worker_id TEXT NOT NULL,"
+            " expires_at REAL NOT NULL"
+            ")"
+        )
+
+    @classmethod
+    def from_config(cls, config):
+        """从 config.yml 的 shard 段创建协调器。"""
+        return cls(
+            path=config.get("path", "shards.db"),
+            worker_id=config.get("worker_id") or None,
+            num_shards=config.get("shards", 64),
+            lease_ttl=config.get("lease_ttl", 60),
+        )
+
+    def heartbeat(self):
+        """上报心跳，按当前存活的 worker 重新计算并获取/续期/释放分片租约。"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO workers (worker_id, heartbeat_at) VALUES (?, ?)"
+                    " ON CONFLICT (worker_id) DO UPDATE SET heartbeat_at = excluded.heartbeat_at",
+                    (self.worker_id, now),
+                )
+                self._conn.execute(
+                    "DELETE FROM workers WHERE heartbeat_at < ?", (now - self.lease_ttl,)
+                )
+                live = [
+                    row[0] for row in self._conn.execute("SELECT worker_id FROM workers")
+                ]
+                ring = HashRing(live)
+                desired = {
+                    shard
+                    for shard in range(self.num_shards)
+                    if ring.get(f"shard:{shard}") == self.worker_id
+                }
+                leases = {
+                    shard: (worker_id, expires_at)
+                    for shard, worker_id, expires_at in self._conn.execute(
+                        "SELECT shard, worker_id, expires_at FROM leases"
+                    )
+                }
+                owned = set()
+                for shard in range(self.num_shards):
+                    holder, expires_at = leases.get(shard, (None, 0))
+                    mine = holder == self.worker_id
+                    # 正在处理的分片即使已不归自己负责也继续续期，本轮结束后再释放
+                    wanted = shard in desired or (mine and shard in self._pinned)
+                    if wanted and (mine or holder is None or expires_at < now):
+                        self._conn.execute(
+                            "INSERT OR REPLACE INTO leases (shard, worker_id, expires_at)"
+                            " VALUES (?, ?, ?)",
+                            (shard, self.worker_id, now + self.lease_ttl),
+                        )
+                        owned.add(shard)
+                    elif mine and shard not in desired:
+                        # 环上已不归自己负责，主动释放以便新的负责人立即接管
+                        self._conn.execute(
+                            "DELETE FROM leases WHERE shard = ? AND worker_id = ?",
+                            (shard, self.worker_id),
+                        )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._owned = frozenset(owned)
+            self._valid_until = now + self.lease_ttl
+        return self._owned
+
+    def owns(self, user_id):
+        return (
+            shard_of(user_id, self.num_shards) in self._owned
+            and time.time() < self._valid_until
+        )
+
+    def filter_users(self, user_ids):
+        """只保留本 worker 持有租约的用户。"""
+        return [user_id for user_id in user_ids if self.owns(user_id)]
+
+    @contextmanager
+    def hold(self, user_ids):
+        """
+        在 with 块内保持这些用户所在分片的租约，产出其中本 worker 持有的用户。
+        """
+        with self._lock:
+            users = self.filter_users(user_ids)
+            shards = {shard_of(user_id, self.num_shards) for user_id in users}
+            self._pinned.update(shards)
+        try:
+            yield users
+        finally:
+            with self._lock:
+                self._pinned.subtract(shards)
+                self._pinned = +self._pinned
+
+    def start(self):
+        """立即上报一次心跳，并在后台线程中每 lease_ttl / 3 秒续期。"""
+        self.heartbeat()
+        self._thread = threading.Thread(target=self._run, name="shard-heartbeat", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.lease_ttl / 3):
+            try:
+                self.heartbeat()
+            except Exception:
+                # 续期失败时放弃全部分片，避免租约过期后与其他 worker 重复处理；
+                # 正在进行的一轮通过 owns() 得知后停止处理这些用户
+                with self._lock:
+                    self._owned = frozenset()
+
+    def stop(self):
+        """停止续期并释放全部租约和心跳，其他 worker 下次心跳即可接管。"""
+        self._stopped.set()
+        with self._lock:
+            self._owned = frozenset()
+            self._conn.execute("DELETE FROM leases WHERE worker_id = ?", (self.worker_id,))
+            self._conn.execute("DELETE FROM workers WHERE worker_id = ?", (self.worker_id,))
@@ -0,0 +1,165 @@
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+from app.utils import metrics
+
+# 熔断器状态
+CLOSED = "closed"  # 正常放行
+OPEN = "open"  # 熔断中，请求不发出
+HALF_OPEN = "half_open"  # 退避结束，只放行一个探测请求
+
+
+class CircuitOpenError(Exception):
+    """主机处于熔断或限速排队已满，请求未发出。"""
+
+    def __init__(self, host, retry_after):
+        super().__init__(f"{host} 限流中，{retry_after:.0f} 秒后重试")
+        self.host = host
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    单个主机的熔断器。
+
+    - 连续 failure_threshold 次被限流后熔断，退避 base_delay * 2^n 秒（带随机抖动，
+      最多 max_delay 秒），期间请求直接抛出 CircuitOpenError，不再消耗请求额度；
+    - 退避结束后只放行一个探测请求，成功则恢复，仍被限流则加倍退避；
+    - 每次被限流时同一主机的请求间隔加倍（最多 max_interval 秒），每次成功后缩短 10%，
+      恢复后以不触发限流的最快速度继续请求。排队等待超过 max_interval 秒的请求
+      直接抛出 CircuitOpenError，限速期间一轮的耗时不会无限拉长。
+    """
+
+    def __init__(
+        self,
+        host,
+        failure_threshold=3,
+        base_delay=30,
+        max_delay=1800,
+        jitter=0.2,
+        max_interval=10,
+    ):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.max_interval = max_interval
+        self.state = CLOSED
+        # 当前的请求间隔（秒），0 表示不限速
+        self.interval = 0.0
+        self._failures = 0
+        self._trips = 0
+        self._open_until = 0.0
+        self._probing = False
+        self._next_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        """
+        发请求前调用：熔断中抛出 CircuitOpenError，限速时阻塞到允许的时间点。
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN:
+                if now < self._open_until:
+                    raise CircuitOpenError(self.host, self._open_until - now)
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == HALF_OPEN:
+                if self._probing:
+                    raise CircuitOpenError(self.host, 1)
+                self._probing = True
+                return
+            wait = max(0.0, self._next_at - now)
+            if wait > self.max_interval:
+                raise CircuitOpenError(self.host, wait)
+            self._next_at = max(now, self._next_at) + self.interval
+        if wait:
+            time.sleep(wait)
+
+    def retry_after(self):
+        """距离可以发出下一个请求还要等待的秒数，0 表示可以立即发出。"""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN:
+                return max(0.0, self._open_until - now)
+            if self.state == HALF_OPEN:
+                return 1.0 if self._probing else 0.0
+            return max(0.0, self._next_at - now)
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self.interval *= 0.9
+            if self.interval < 0.05:
+                self.interval = 0.0
+            if self.state == HALF_OPEN:
+                # 探测成功，沿用熔断前收敛到的请求间隔
+                self.state = CLOSED
+                self._trips = 0
+                self._probing = False
+
+    def record_throttled(self):
+        """记录一次限流响应（403/418/429、验证码页面等）。"""
+        with self._lock:
+            self._failures += 1
+            self.interval = min(self.max_interval, max(0.5, self.interval * 2))
+            if self.state == HALF_OPEN or (
+                self.state == CLOSED and self._failures >= self.failure_threshold
+            ):
+                delay = min(self.max_delay, self.base_delay * 2**self._trips)
+                delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+                self._open_until = time.monotonic() + delay
+                self._trips += 1
+                self._probing = False
+                self.state = OPEN
+                metrics.inc("circuit_open_total", help="Circuit breaker trips", host=self.host)
+
+    def record_error(self):
+        """记录一次与限流无关的失败（超时、连接错误），不影响熔断计数。"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                # 探测请求没有结果，允许下一个请求继续探测
+                self._probing = False
+
+
+class CircuitBreakers:
+    """按主机维护熔断器。"""
+
+    def __init__(self, **options):
+        self.options = options
+        self._lock = threading.Lock()
+        self._breakers = {}
+
+    def get(self, url):
+        """url 所属主机的熔断器。"""
+        host = urlsplit(url).hostname or ""
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = self._breakers[host] = CircuitBreaker(host, **self.options)
+            return breaker
+
+
+_lock = threading.Lock()
+_default_breakers = None
+
+
+def configure(**options):
+    """按配置（config.yml 中的 circuit_breaker 段）重建共享的熔断器。"""
+    global _default_breakers
+    with _lock:
+        _default_breakers = CircuitBreakers(**options)
+        return _default_breakers
+
+
+def get_breakers():
+    """获取共享的熔断器，未配置时使用默认参数创建。"""
+    global _default_breakers
+    with _lock:
+        if _default_breakers is None:
+            _default_breakers = CircuitBreakers()
+        return _default_breakers
@@ -0,0 +1,100 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+
+class HostLimiter:
+    """按主机限制同时进行中的请求数量。"""
+
+    def __init__(self, per_host):
+        self.per_host = per_host
+        self._lock = threading.Lock()
+        self._semaphores = {}
+
+    def _semaphore(self, host):
+        with self._lock:
+            semaphore = self._semaphores.get(host)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.per_host)
+                self._semaphores[host] = semaphore
+            return semaphore
+
+    @contextmanager
+    def limit(self, url):
+        """在 with 块内占用 url 所属主机的一个并发名额。"""
+        if not self.per_host or self.per_host <= 0:
+            yield
+            return
+        semaphore = self._semaphore(urlsplit(url).hostname or "")
+        with semaphore:
+            yield
+
+
+# 工作线程退出的标记
+_WORKER_DONE = object()
+
+
+class DeadlineExceeded(Exception):
+    """本轮时限已到，任务没有开始执行。"""
+
+
+def run_concurrently(func, items, max_workers, deadline=None):
+    """
+    并发执行 func(item)，按完成顺序逐个产出结果。
+
+    参数：
+    - func: 对每个元素调用的函数
+    - items: 待处理的元素列表
+    - max_workers: 最大同时执行数
+    - deadline: time.monotonic() 时间点，到期后不再开始新的任务，已开始的照常完成
+
+    返回值：
+    - 生成器，产出 (item, result, error)，出错时 result 为 None；
+      到期未开始的元素最后按原顺序产出，error 为 DeadlineExceeded
+    """
+    items = list(items)
+    if not items:
+        return
+    max_workers = max(1, min(max_workers or 1, len(items)))
+    remaining = deque(items)
+    lock = threading.Lock()
+    results = queue.Queue()
+
+    def worker():
+        # 每个线程循环取任务，到期后不再取
+        try:
+            while True:
+                with lock:
+                    if not remaining or (deadline is not None and time.monotonic() >= deadline):
+                        return
+                    item = remaining.popleft()
+                try:
+                    results.put((item, func(item), None))
+                except Exception as e:
+                    results.put((item, None, e))
+        finally:
+            results.put(_WORKER_DONE)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for _ in range(max_workers):
+            executor.submit(worker)
+        running = max_workers
+        try:
+            while running:
+                result = results.get()
+                if result is _WORKER_DONE:
+                    running -= 1
+                    continue
+                yield result
+        finally:
+            if running:
+                # 调用方提前退出，不再开始剩余的任务
+                with lock:
+                    remaining.clear()
+    for item in remaining:
+        yield item, None, DeadlineExceeded(f"本轮时限已到: {item}")
+
@@ -0,0 +1,492 @@
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+
+class JsonSentStore:
+    """
+    旧版去重存储：整个 sent_ids.json 读入内存，flush 时整体重写。
+
+    写入先落到临时文件再原子替换，避免中途崩溃损坏文件。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._sent_ids = {}
+        self._dirty = False
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for user_id, ids in json.load(f).items():
+                    self._sent_ids[user_id] = set(ids)
+
+    def contains(self, user_id, post_id):
+        with self._lock:
+            return post_id in self._sent_ids.get(user_id, ())
+
+    def filter_new(self, user_id, post_ids):
+        with self._lock:
+            user_sent_ids = self._sent_ids.get(user_id, ())
+            return [post_id for post_id in post_ids if post_id not in user_sent_ids]
+
+    def add(self, user_id, post_id):
+        with self._lock:
+            self._sent_ids.setdefault(user_id, set()).add(post_id)
+            self._dirty = True
+
+    def has_user(self, user_id):
+        """是否已有该用户的去重记录（已建档）。"""
+        with self._lock:
+            return user_id in self._sent_ids
+
+    def get_cursor(self, user_id):
+        """已发送博文中最新（ID 最大）的一条，旧版格式没有单独的游标，按需计算。"""
+        with self._lock:
+            numeric_ids = [
+                int(post_id)
+                for post_id in self._sent_ids.get(user_id, ())
+                if str(post_id).isdigit()
+            ]
+        return str(max(numeric_ids)) if numeric_ids else None
+
+    def advance_cursor(self, user_id, post_id):
+        # 游标由已发送ID推导，无需单独记录；只记下该用户已建档
+        with self._lock:
+            if user_id not in self._sent_ids:
+                self._sent_ids[user_id] = set()
+                self._dirty = True
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            serializable = {user_id: list(ids) for user_id, ids in self._sent_ids.items()}
+            self._dirty = False
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(serializable, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def close(self):
+        self.flush()
+
+
+class SqliteSentStore:
+    """
+    基于 SQLite（WAL 模式）的去重存储。
+
+    (user_id, post_id) 为主键，按帖子增量写入，每次 add 即提交。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sent_ids ("
+            " user_id TEXT NOT NULL,"
+            " post_id TEXT NOT NULL,"
+            " sent_at REAL NOT NULL,"
+            " PRIMARY KEY (user_id, post_id)"
+            ") WITHOUT ROWID"
+        )
+        # 每个用户已处理过的最新博文ID，用于增量抓取时提前停止
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cursors ("
+            " user_id TEXT PRIMARY KEY,"
+            " newest_id INTEGER NOT NULL"
+            ")"
+        )
+
+    def contains(self, user_id, post_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM sent_ids WHERE user_id = ? AND post_id = ?",
+                (user_id, post_id),
+            ).fetchone()
+        return row is not None
+
+    def filter_new(self, user_id, post_ids):
+        post_ids = list(post_ids)
+        if not post_ids:
+            return []
+        placeholders = ",".join("?" * len(post_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT post_id FROM sent_ids WHERE user_id = ? AND post_id IN ({placeholders})",
+                (user_id, *post_ids),
+            ).fetchall()
+        known = {row[0] for row in rows}
+        return [post_id for post_id in post_ids if post_id not in known]
+
+    def add(self, user_id, post_id):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO sent_ids (user_id, post_id, sent_at) VALUES (?, ?, ?)",
+                    (user_id, post_id, time.time()),
+                )
+                self._advance_cursor(user_id, post_id)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def has_user(self, user_id):
+        """是否已有该用户的去重记录（已建档）：已发送的博文或游标。"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM sent_ids WHERE user_id = ?"
+                " UNION ALL SELECT 1 FROM cursors WHERE user_id = ? LIMIT 1",
+                (user_id, user_id),
+            ).fetchone()
+        return row is not None
+
+    def get_cursor(self, user_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT newest_id FROM cursors WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return str(row[0]) if row else None
+
+    def advance_cursor(self, user_id, post_id):
+        """把用户游标推进到 post_id（只前进不后退）。"""
+        with self._lock:
+            self._advance_cursor(user_id, post_id)
+
+    def _advance_cursor(self, user_id, post_id):
+        if not str(post_id).isdigit():
+            return
+        self._conn.execute(
+            "INSERT INTO cursors (user_id, newest_id) VALUES (?, ?)"
+            " ON CONFLICT (user_id) DO UPDATE SET newest_id = MAX(newest_id, excluded.newest_id)",
+            (user_id, int(post_id)),
+        )
+
+    def migrate_from_json(self, json_path):
+        """把旧的 sent_ids.json 一次性导入，导入后重命名为 .migrated。"""
+        if not os.path.exists(json_path):
+            return 0
+        with open(json_path, "r", encoding="utf-8") as f:
+            sent_ids = json.load(f)
+        now = time.time()
+        rows = [
+            (str(user_id), str(post_id), now)
+            for user_id, ids in sent_ids.items()
+            for post_id in ids
+        ]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO sent_ids (user_id, post_id, sent_at) VALUES (?, ?, ?)",
+                    rows,
+                )
+                # 游标取每个用户已发送的最大数字ID
+                for user_id, ids in sent_ids.items():
+                    numeric_ids = [int(post_id) for post_id in ids if str(post_id).isdigit()]
+                    if numeric_ids:
+                        self._advance_cursor(str(user_id), str(max(numeric_ids)))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        os.replace(json_path, f"{json_path}.migrated")
+        return len(rows)
+
+    def flush(self):
+        # 每次 add 都已提交，无需额外操作
+        pass
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class BloomFilter:
+    """固定大小的布隆过滤器，按容量和误判率计算位数与哈希次数。"""
+
+    def __init__(self, capacity, error_rate=0.001, bits=None, count=0):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray(bits) if bits is not None else bytearray((self.size + 7) // 8)
+        self.count = count
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        size = self.size
+        h1 = int.from_bytes(digest[:8], "big") % size
+        h2 = int.from_bytes(digest[8:], "big") % size or 1
+        return [(h1 + i * h2) % size for i in range(self.hashes)]
+
+    def add(self, key):
+        bits = self.bits
+        for position in self._positions(key):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        bits = self.bits
+        for position in self._positions(key):
+            if not bits[position >> 3] & 1 << (position & 7):
+                return False
+        return True
+
+
+class CompactSentStore:
+    """
+    常驻内存的紧凑去重存储，适合长期运行、监控大量用户的守护进程。
+
+    每个用户只保留最新的 window 个数字博文ID，存放在有序的 array('q') 中（二分查找），
+    比 window 更旧的ID由可选的布隆过滤器兜底；布隆过滤器分新旧两代轮换，
+    内存占用不随运行时间增长。未开启布隆过滤器时，比窗口内最旧ID还旧的博文视为已发送，
+    getIndex 翻页深度有限，不会再返回这些博文。
+
+    状态保存在与 sqlite 后端相同的 SQLite 文件中，flush 时只写入有变化的用户；
+    首次打开时从 sqlite 后端的 sent_ids 表导入。
+    """
+
+    def __init__(self, path, window=64, bloom_capacity=1000000, bloom_error_rate=0.001):
+        self.path = path
+        self.window = window
+        self.bloom_capacity = bloom_capacity
+        self.bloom_error_rate = bloom_error_rate
+        self._lock = threading.Lock()
+        self._windows = {}
+        self._cursors = {}
+        self._dirty = set()
+        self._blooms = []
+        self._bloom_dirty = False
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sent_windows ("
+            " user_id TEXT PRIMARY KEY,"
+            " post_ids BLOB NOT NULL,"
+            " newest_id INTEGER"
+            ")"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sent_blooms ("
+            " generation INTEGER PRIMARY KEY,"
+            " bits BLOB NOT NULL,"
+            " count INTEGER NOT NULL"
+            ")"
+        )
+        self._load()
+
+    def _new_bloom(self, bits=None, count=0):
+        return BloomFilter(self.bloom_capacity, self.bloom_error_rate, bits, count)
+
+    def _load(self):
+        for user_id, post_ids, newest_id in self._conn.execute(
+            "SELECT user_id, post_ids, newest_id FROM sent_windows"
+        ):
+            ids = array("q")
+            ids.frombytes(post_ids)
+            self._windows[user_id] = ids
+            if newest_id is not None:
+                self._cursors[user_id] = newest_id
+        if self.bloom_capacity:
+            rows = self._conn.execute(
+                "SELECT bits, count FROM sent_blooms ORDER BY generation"
+            ).fetchall()
+            blooms = [self._new_bloom(bits, count) for bits, count in rows]
+            # 容量或误判率修改后旧的位数组不可用，重新开始
+            self._blooms = [b for b in blooms if len(b.bits) == (b.size + 7) // 8] or [
+                self._new_bloom()
+            ]
+
+    @staticmethod
+    def _key(user_id, post_id):
+        return f"{user_id}:{post_id}"
+
+    def _contains(self, user_id, post_id):
+        key = self._key(user_id, post_id)
+        if not str(post_id).isdigit():
+            return any(key in bloom for bloom in self._blooms)
+        value = int(post_id)
+        ids = self._windows.get(user_id)
+        if ids:
+            index = bisect_left(ids, value)
+            if index < len(ids) and ids[index] == value:
+                return True
+            if len(ids) >= self.window and value < ids[0]:
+                # 比窗口更旧：有布隆过滤器时由它判断，否则视为已发送
+                return any(key in bloom for bloom in self._blooms) if self._blooms else True
+        return False
+
+    def contains(self, user_id, post_id):
+        with self._lock:
+            return self._contains(user_id, post_id)
+
+    def filter_new(self, user_id, post_ids):
+        with self._lock:
+            return [post_id for post_id in post_ids if not self._contains(user_id, post_id)]
+
+    def _add(self, user_id, post_id):
+        if self._blooms:
+            bloom = self._blooms[-1]
+            if bloom.count >= self.bloom_capacity:
+                # 当前一代已满，丢弃最旧的一代
+                bloom = self._new_bloom()
+                self._blooms = [self._blooms[-1], bloom]
+            bloom.add(self._key(user_id, post_id))
+            self._bloom_dirty = True
+        if not str(post_id).isdigit():
+            return
+        value = int(post_id)
+        ids = self._windows.get(user_id)
+        if ids is None:
+            ids = self._windows[user_id] = array("q")
+        index = bisect_left(ids, value)
+        if index < len(ids) and ids[index] == value:
+            return
+        if len(ids) >= self.window:
+            if index == 0:
+                return
+            ids.insert(index, value)
+            del ids[0]
+        else:
+            ids.insert(index, value)
+        self._dirty.add(user_id)
+
+    def add(self, user_id, post_id):
+        with self._lock:
+            self._add(user_id, post_id)
+            self._advance_cursor(user_id, post_id)
+
+    def has_user(self, user_id):
+        """是否已有该用户的去重记录（已建档）。"""
+        with self._lock:
+            return user_id in self._windows or user_id in self._cursors
+
+    def get_cursor(self, user_id):
+        with self._lock:
+            ids = self._windows.get(user_id)
+            newest = max(self._cursors.get(user_id, 0), ids[-1] if ids else 0)
+        return str(newest) if newest else None
+
+    def advance_cursor(self, user_id, post_id):
+        """把用户游标推进到 post_id（只前进不后退）。"""
+        with self._lock:
+            self._advance_cursor(user_id, post_id)
+
+    def _advance_cursor(self, user_id, post_id):
+        if str(post_id).isdigit() and int(post_id) > self._cursors.get(user_id, -1):
+            self._cursors[user_id] = int(post_id)
+            self._dirty.add(user_id)
+
+    def migrate_from_sqlite(self):
+        """首次使用时从同一文件中 sqlite 后端的 sent_ids / cursors 表导入。"""
+        with self._lock:
+            if self._windows:
+                return 0
+            tables = {
+                row[0]
+                for row in self._conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+            }
+            if "sent_ids" not in tables:
+                return 0
+            count = 0
+            for user_id, post_id in self._conn.execute("SELECT user_id, post_id FROM sent_ids"):
+                self._add(user_id, post_id)
+                self._advance_cursor(user_id, post_id)
+                count += 1
+            if "cursors" in tables:
+                for user_id, newest_id in self._conn.execute("SELECT user_id, newest_id FROM cursors"):
+                    self._advance_cursor(user_id, newest_id)
+        self.flush()
+        return count
+
+    def migrate_from_json(self, json_path):
+        """把旧的 sent_ids.json 一次性导入，导入后重命名为 .migrated。"""
+        if not os.path.exists(json_path):
+            return 0
+        with open(json_path, "r", encoding="utf-8") as f:
+            sent_ids = json.load(f)
+        count = 0
+        with self._lock:
+            for user_id, ids in sent_ids.items():
+                for post_id in ids:
+                    self._add(str(user_id), str(post_id))
+                    self._advance_cursor(str(user_id), str(post_id))
+                    count += 1
+        self.flush()
+        os.replace(json_path, f"{json_path}.migrated")
+        return count
+
+    def flush(self):
+        """把有变化的用户窗口和布隆过滤器写入 SQLite。"""
+        with self._lock:
+            rows = [
+                (user_id, self._windows.get(user_id, array("q")).tobytes(), self._cursors.get(user_id))
+                for user_id in self._dirty
+            ]
+            self._dirty = set()
+            blooms = None
+            if self._bloom_dirty:
+                blooms = [(i, bytes(b.bits), b.count) for i, b in enumerate(self._blooms)]
+                self._bloom_dirty = False
+            if not rows and blooms is None:
+                return
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO sent_windows (user_id, post_ids, newest_id) VALUES (?, ?, ?)",
+                    rows,
+                )
+                if blooms is not None:
+                    self._conn.execute("DELETE FROM sent_blooms")
+                    self._conn.executemany(
+                        "INSERT INTO sent_blooms (generation, bits, count) VALUES (?, ?, ?)", blooms
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._conn.close()
+
+
+def open_sent_store(backend="sqlite", path="sent_ids.db", json_path="sent_ids.json", **options):
+    """
+    按配置打开去重存储。
+
+    参数：
+    - backend: "sqlite"、"compact" 或 "json"
+    - path: SQLite 数据库文件路径
+    - json_path: 旧版 sent_ids.json 路径，sqlite / compact 模式下首次打开时自动迁移
+    - options: compact 模式的 window、bloom_capacity、bloom_error_rate
+
+    返回值：
+    - 去重存储对象，提供 contains / filter_new / add / has_user / get_cursor / advance_cursor / flush / close
+    """
+    if backend == "json":
+        return JsonSentStore(json_path)
+    if backend == "sqlite":
+        store = SqliteSentStore(path)
+        store.migrate_from_json(json_path)
+        return store
+    if backend == "compact":
+        store = CompactSentStore(path, **options)
+        store.migrate_from_sqlite()
+        store.migrate_from_json(json_path)
+        return store
+    raise ValueError(f"未知的去重存储类型: {backend}")
@@ -0,0 +1,173 @@
+import queue
+import random
+import threading
+import time
+
+from app.utils import metrics
+from app.utils.lark_boot_webhook_msg import is_rate_limited
+
+# join 超时后被丢弃、没有发出的卡片
+CANCELLED = object()
+
+
+class TokenBucket:
+    """令牌桶限流器：每秒补充 rate 个令牌，最多积攒 capacity 个。"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取走一个令牌，没有可用令牌时阻塞等待。"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class DeliveryQueue:
+    """
+    飞书 Webhook 的异步发送队列。
+
+    后台线程按令牌桶限速（默认匹配自定义机器人 5 次/秒、100 次/分钟的限额）
+    依次发送卡片；遇到限流错误码时指数退避后重发同一条，累计退避超过
+    rate_limit_timeout 秒后放弃，其他错误重试 max_attempts 次后放弃。
+    抓取线程只需 submit，不会被发送阻塞。
+    """
+
+    def __init__(
+        self,
+        bot,
+        per_second=5,
+        per_minute=100,
+        max_attempts=3,
+        max_backoff=60,
+        rate_limit_timeout=300,
+        log=None,
+        name="lark-delivery",
+    ):
+        self.bot = bot
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+        self.rate_limit_timeout = rate_limit_timeout
+        self.log = log
+        # 任意时间窗内最多放行 capacity + rate * 窗口长度 个请求：
+        # 秒级桶容量为 1，均匀放行；分钟级桶允许 per_second 的突发，剩余额度匀速补充
+        burst = min(per_second, per_minute)
+        self._buckets = [
+            TokenBucket(per_second, 1),
+            TokenBucket(max(per_minute - burst, 1) / 60, burst),
+        ]
+        self._queue = queue.Queue()
+        # join 超时后置位：丢弃尚未发出的卡片，中断正在进行的重试
+        self._cancel = threading.Event()
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+
+    def submit(self, card, on_sent=None, on_failed=None):
+        """
+        提交一张卡片等待发送。
+
+        参数：
+        - card: build_card_message 构建的卡片
+        - on_sent: 发送成功后在发送线程中调用的回调
+        - on_failed: 最终放弃时调用的回调，参数为最后一次的返回值
+        """
+        self._queue.put((card, on_sent, on_failed))
+
+    def join(self, timeout=None):
+        """
+        等待队列中已提交的卡片全部处理完。
+
+        超过 timeout 秒时丢弃尚未发出的卡片（不调用回调，由调用方下次重新提交），
+        等正在发送的一条结束后返回 False。
+        """
+        if self._wait(timeout):
+            return True
+        self._cancel.set()
+        try:
+            self._wait(None)
+        finally:
+            self._cancel.clear()
+        return False
+
+    def _wait(self, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def _send(self, card):
+        """发送一张卡片，返回最后一次的返回值；被 join 取消时返回 CANCELLED。"""
+        attempts = 0
+        backoff = 1
+        rate_limited_since = None
+        while True:
+            if self._cancel.is_set():
+                return CANCELLED
+            for bucket in self._buckets:
+                bucket.acquire()
+            try:
+                rsp = self.bot.send_card_msg(card=card)
+            except Exception as e:
+                rsp = {"code": -1, "msg": str(e)}
+            if rsp and rsp.get("code") == 0:
+                return rsp
+            metrics.inc(
+                "delivery_retries_total",
+                reason="rate_limited" if is_rate_limited(rsp) else "error",
+            )
+            if is_rate_limited(rsp):
+                # 被限流时不计入失败次数，退避后重发，累计超过 rate_limit_timeout 秒后放弃
+                now = time.monotonic()
+                if rate_limited_since is None:
+                    rate_limited_since = now
+                elif now - rate_limited_since >= self.rate_limit_timeout:
+                    return rsp
+                self._warn(f"飞书限流，{backoff} 秒后重试: {rsp}")
+            else:
+                attempts += 1
+                if attempts >= self.max_attempts:
+                    return rsp
+                self._warn(f"发送失败，第 {attempts} 次: {rsp}")
+            if self._cancel.wait(backoff * random.uniform(1, 1.5)):
+                return CANCELLED
+            backoff = min(self.max_backoff, backoff * 2)
+
+    def _warn(self, message):
+        if self.log is not None:
+            self.log.warning(message)
+
+    def _run(self):
+        while True:
+            card, on_sent, on_failed = self._queue.get()
+            try:
+                rsp = CANCELLED if self._cancel.is_set() else self._send(card)
+                if rsp is CANCELLED:
+                    metrics.inc("delivery_cancelled_total", help="Cards dropped by a join timeout")
+                elif rsp and rsp.get("code") == 0:
+                    if on_sent is not None:
+                        on_sent()
+                else:
+                    self._warn(f"放弃发送卡片: {rsp}")
+                    if on_failed is not None:
+                        on_failed(rsp)
+            except Exception as e:
+                self._warn(f"发送回调异常: {e}")
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,131 @@
+import re
+import threading
+import time
+from collections import namedtuple
+
+from app.utils.lark_boot_webhook_msg import build_card_message, dump_card
+
+# 飞书自定义机器人的请求体上限约 20 KB，卡片需留出签名等字段的余量
+DEFAULT_MAX_CARD_BYTES = 18 * 1024
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_SPACE_RE = re.compile(r"\s+")
+
+# 等待合并发送的一条博文
+DigestEntry = namedtuple("DigestEntry", "user_id post image_keys added_at")
+
+
+def summarize(text, length):
+    """去掉 HTML 标签，截取前 length 个字符作为摘要。"""
+    text = _SPACE_RE.sub(" ", _TAG_RE.sub(" ", text or "")).strip()
+    return text if len(text) <= length else text[:length] + "…"
+
+
+class DigestBuffer:
+    """
+    摘要模式的待发送缓冲区。
+
+    博文按推送目标和分组（scope 为 user 时按用户，global 时所有用户一组）缓存，
+    组内最早的博文发布已超过 window 秒，或攒够 max_posts 条时整组取出合并发送。
+    以发布时间计时：停机恢复后积压的博文会立即合并成少量卡片。
+    """
+
+    def __init__(self, window=300, max_posts=20, scope="user"):
+        if scope not in ("user", "global"):
+            raise Exception(f"digest.scope 只能是 user 或 global: {scope}")
+        self.window = window
+        self.max_posts = max_posts
+        self.scope = scope
+        self._lock = threading.Lock()
+        self._groups = {}
+
+    def add(self, target, user_id, post, image_keys):
+        """缓存一条博文，已在缓冲区中时返回 False。"""
+        key = (target, user_id if self.scope == "user" else None)
+        with self._lock:
+            entries = self._groups.setdefault(key, {})
+            if (user_id, post.id) in entries:
+                return False
+            entries[(user_id, post.id)] = DigestEntry(
+                user_id, post, image_keys or [], post.created_at or time.time()
+            )
+            return True
+
+    def pop_due(self, force=False):
+        """取出到期的分组，返回 [(target, entries)]，entries 按发布时间从旧到新。"""
+        now = time.time()
+        due = []
+        with self._lock:
+            for key, entries in list(self._groups.items()):
+                oldest = min(entry.added_at for entry in entries.values())
+                if force or len(entries) >= self.max_posts or now - oldest >= self.window:
+                    del self._groups[key]
+                    due.append(
+                        (key[0], sorted(entries.values(), key=lambda entry: entry.added_at))
+                    )
+        return due
+
+
+def _entry_elements(entry, summary_length):
+    post = entry.post
+    elements = [
+        {
+            "tag": "markdown",
+            "content": f"**{post.username}**：{summarize(post.text, summary_length)} [查看]({post.link})",
+        }
+    ]
+    if entry.image_keys:
+        # 只放第一张图片的缩略图
+        elements.append(
+            {
+                "tag": "img",
+                "img_key": entry.image_keys[0],
+                "alt": {"tag": "plain_text", "content": ""},
+                "mode": "tiny",
+            }
+        )
+    return elements
+
+
+def build_digest_cards(entries, summary_length=80, max_card_bytes=DEFAULT_MAX_CARD_BYTES):
+    """
+    把多条博文合并成摘要卡片，超过 max_card_bytes 时自动拆分成多张。
+
+    只有一条博文时使用普通卡片，保留全文和所有图片。
+
+    返回值：
+    - [(序列化后的卡片, 该卡片包含的 entries)]
+    """
+    if len(entries) == 1:
+        post = entries[0].post
+        card = build_card_message(
+            post.username, f"{post.text}\n[快速链接]({post.link})", entries[0].image_keys
+        )
+        return [(dump_card(card), entries)]
+
+    base_size = len(dump_card(build_card_message("", "")).encode("utf-8")) + 64
+    batches = []
+    batch, elements, size = [], [], base_size
+    for entry in entries:
+        entry_elements = _entry_elements(entry, summary_length)
+        entry_size = sum(len(dump_card(element).encode("utf-8")) + 2 for element in entry_elements)
+        if batch and size + entry_size > max_card_bytes:
+            batches.append((batch, elements))
+            batch, elements, size = [], [], base_size
+        batch.append(entry)
+        elements.extend(entry_elements)
+        size += entry_size
+    batches.append((batch, elements))
+
+    usernames = {entry.post.username for entry in entries}
+    title = f"{usernames.pop()} 的新博文" if len(usernames) == 1 else "新博文摘要"
+    cards = []
+    for index, (batch, elements) in enumerate(batches):
+        suffix = f"（{index + 1}/{len(batches)}）" if len(batches) > 1 else ""
+        card = {
+            "header": {"title": {"tag": "plain_text", "content": f"{title}：{len(batch)} 条{suffix}"}},
+            "elements": elements,
+            "config": {"wide_screen_mode": True},
+        }
+        cards.append((dump_card(card), batch))
+    return cards
@@ -0,0 +1,211 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_URL_RE = re.compile(r"https?://\S+")
+_SPACE_RE = re.compile(r"\s+")
+
+# SimHash 分为 4 段各 16 位：海明距离不超过 3 的两个指纹至少有一段完全相同
+BANDS = 4
+BAND_BITS = 16
+
+# 与新博文重复的已推送博文
+Match = namedtuple("Match", "user_id post_id username link")
+
+
+def normalize_text(text):
+    """去掉 HTML 标签、链接和空白，只保留用于比较的正文。"""
+    text = _TAG_RE.sub("", text or "")
+    text = _URL_RE.sub("", text)
+    return _SPACE_RE.sub("", text)
+
+
+def simhash(text, shingle=3):
+    """按字符 shingle 计算 64 位 SimHash，内容相近的文本海明距离小。"""
+    weights = [0] * 64
+    if len(text) <= shingle:
+        grams = [text] if text else []
+    else:
+        grams = (text[i : i + shingle] for i in range(len(text) - shingle + 1))
+    for gram in grams:
+        value = int.from_bytes(
+            hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest(), "big"
+        )
+        for bit in range(64):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    result = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            result |= 1 << bit
+    return result
+
+
+def image_id(url):
+    """微博图片的文件名（去掉尺寸路径段和扩展名），转发时同一张图片的文件名相同。"""
+    name = url.rsplit("/", 1)[-1].split("?", 1)[0]
+    return name.rsplit(".", 1)[0]
+
+
+def _to_signed(value):
+    # SQLite 的 INTEGER 为有符号 64 位
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _bands(value):
+    mask = (1 << BAND_BITS) - 1
+    return [value >> (i * BAND_BITS) & mask for i in range(BANDS)]
+
+
+class FingerprintIndex:
+    """
+    近似重复内容索引。
+
+    记录最近 window 秒内推送过的博文的正文 SimHash 和图片文件名。正文海明距离
+    不超过 max_distance（且长度至少 min_text_length）、图片也都出现过的博文，
+    或正文很短、图片与之前完全相同的博文，视为重复，例如多个账号转发同一内容、
+    同一账号重新发布。
+    """
+
+    def __init__(self, path="fingerprints.db", window=24 * 3600, max_distance=3, min_text_length=10):
+        if max_distance >= BANDS:
+            raise Exception(f"max_distance 不能超过 {BANDS - 1}")
+        self.window = window
+        self.max_distance = max_distance
+        self.min_text_length = min_text_length
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fingerprints ("
+            " user_id TEXT NOT NULL,"
+            " post_id TEXT NOT NULL,"
+            " simhash INTEGER,"
+            " band0 INTEGER, band1 INTEGER, band2 INTEGER, band3 INTEGER,"
+            " image_ids TEXT NOT NULL,"
+            " username TEXT,"
+            " link TEXT,"
+            " created_at REAL NOT NULL,"
+            " PRIMARY KEY (user_id, post_id)"
+            ")"
+        )
+        for i in range(BANDS):
+            self._conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_fingerprints_band{i} ON fingerprints (band{i})"
+            )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fingerprint_images ("
+            " image_id TEXT NOT NULL,"
+            " user_id TEXT NOT NULL,"
+            " post_id TEXT NOT NULL,"
+            " created_at REAL NOT NULL"
+            ")"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_fingerprint_images_id ON fingerprint_images (image_id)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_fingerprints_created ON fingerprints (created_at)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_fingerprint_images_created"
+            " ON fingerprint_images (created_at)"
+        )
+
+    def _fingerprint(self, post):
+        text = normalize_text(post.text)
+        value = simhash(text) if len(text) >= self.min_text_length else None
+        return value, sorted({image_id(url) for url in post.image_urls if url})
+
+    def find(self, user_id, post):
+        """
+        查找与 post 重复的已推送博文。
+
+        返回值：
+        - Match，没有重复时返回 None。同一条博文（重试、恢复）不算重复
+        """
+        value, images = self._fingerprint(post)
+        since = time.time() - self.window
+        candidates = []
+        with self._lock:
+            if value is not None:
+                bands = _bands(value)
+                candidates = self._conn.execute(
+                    "SELECT user_id, post_id, simhash, image_ids, username, link FROM fingerprints"
+                    " WHERE created_at > ? AND (band0 = ? OR band1 = ? OR band2 = ? OR band3 = ?)"
+                    " ORDER BY created_at",
+                    (since, *bands),
+                ).fetchall()
+            elif images:
+                # 正文太短时只看图片：找出包含第一张图片的博文，再比较图片集合
+                candidates = self._conn.execute(
+                    "SELECT f.user_id, f.post_id, f.simhash, f.image_ids, f.username, f.link"
+                    " FROM fingerprint_images i JOIN fingerprints f"
+                    " ON f.user_id = i.user_id AND f.post_id = i.post_id"
+                    " WHERE i.image_id = ? AND f.created_at > ? ORDER BY f.created_at",
+                    (images[0], since),
+                ).fetchall()
+        for other_user, other_post, other_hash, other_images, username, link in candidates:
+            if (other_user, other_post) == (user_id, post.id):
+                continue
+            other_images = set(json.loads(other_images))
+            if value is not None:
+                distance = (value ^ (other_hash % (1 << 64))).bit_count()
+                if distance <= self.max_distance and set(images) <= other_images:
+                    return Match(other_user, other_post, username, link)
+            elif set(images) == other_images:
+                return Match(other_user, other_post, username, link)
+        return None
+
+    def add(self, user_id, post):
+        """记录已推送（或即将推送）的博文。"""
+        value, images = self._fingerprint(post)
+        bands = _bands(value) if value is not None else [None] * BANDS
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO fingerprints"
+                    " (user_id, post_id, simhash, band0, band1, band2, band3,"
+                    " image_ids, username, link, created_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        user_id,
+                        post.id,
+                        _to_signed(value) if value is not None else None,
+                        *bands,
+                        json.dumps(images),
+                        post.username,
+                        post.link,
+                        now,
+                    ),
+                )
+                self._conn.execute(
+                    "DELETE FROM fingerprint_images WHERE user_id = ? AND post_id = ?",
+                    (user_id, post.id),
+                )
+                self._conn.executemany(
+                    "INSERT INTO fingerprint_images (image_id, user_id, post_id, created_at)"
+                    " VALUES (?, ?, ?, ?)",
+                    [(image, user_id, post.id, now) for image in images],
+                )
+                self._evict(now)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _evict(self, now):
+        since = now - self.window
+        self._conn.execute("DELETE FROM fingerprints WHERE created_at <= ?", (since,))
+        self._conn.execute("DELETE FROM fingerprint_images WHERE created_at <= ?", (since,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,24 +1,130 @@
-import requests
+import hashlib
+import time
+from collections import namedtuple
+from contextlib import closing
+from tempfile import SpooledTemporaryFile
 
+from app.utils.circuit import get_breakers
+from app.utils.transport import get_transport
 
-def fetch_image(url, headers=None):
+# 单张图片的默认大小上限，以及超过多少字节后落盘
+DEFAULT_MAX_BYTES = 20 * 1024 * 1024
+DEFAULT_SPOOL_THRESHOLD = 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+# 除 image/* 外允许的 Content-Type，部分 CDN 节点只返回通用二进制类型
+ALLOWED_CONTENT_TYPES = ("application/octet-stream",)
+
+# 图片 CDN 限流时返回的状态码，403 多为防盗链，不计入限流
+IMAGE_THROTTLE_STATUS_CODES = (418, 429)
+
+DownloadedImage = namedtuple("DownloadedImage", "file sha256 content_type size")
+
+
+class ImageRejectedError(Exception):
+    """图片类型不符或超过大小限制，重试也不会成功。"""
+
+
+class ImageTooLargeError(ImageRejectedError):
+    """图片超过大小限制，可以改用更小的尺寸。"""
+
+
+def download_image(
+    url,
+    headers=None,
+    max_bytes=DEFAULT_MAX_BYTES,
+    spool_threshold=DEFAULT_SPOOL_THRESHOLD,
+    transport=None,
+):
+    """
+    Streams an image into a SpooledTemporaryFile, hashing it on the way.
+
+    Small images stay in memory, larger ones spill to disk once they exceed
+    spool_threshold. The download is aborted as soon as the response turns out
+    to be a non-image or grows beyond max_bytes.
+
+    Parameters:
+    url (str): URL to the image to be fetched.
+    headers (dict, optional): HTTP headers to be used in the request.
+    max_bytes (int): Maximum accepted image size.
+    spool_threshold (int): Size above which the image is spooled to disk.
+    transport (Transport, optional): Transport to use instead of the shared one.
+
+    Returns:
+    DownloadedImage: file object positioned at 0, SHA-256 hex digest,
+    content type and size. The caller is responsible for closing the file.
+
+    Raises:
+    ImageRejectedError: content type is not an image or the image is too large.
+    CircuitOpenError: the image host is being throttled, no request was made.
+    """
+    transport = transport or get_transport()
+    breaker = get_breakers().get(url)
+    breaker.before_request()
+    try:
+        response = transport.get(url, headers=headers, stream=True)
+    except Exception:
+        breaker.record_error()
+        raise
+    with closing(response):
+        if response.status_code in IMAGE_THROTTLE_STATUS_CODES:
+            breaker.record_throttled()
+            raise Exception(f"图片服务器限流，状态码: {response.status_code}")
+        if response.status_code != 200:
+            breaker.record_error()
+            raise Exception(f"无法下载图片，状态码: {response.status_code}")
+        breaker.record_success()
+
+        content_type = response.headers.get("Content-Type", "").split(";")[0].strip()
+        if content_type and not (
+            content_type.startswith("image/") or content_type in ALLOWED_CONTENT_TYPES
+        ):
+            raise ImageRejectedError(f"非图片内容: {content_type} {url}")
+
+        content_length = response.headers.get("Content-Length")
+        if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+            raise ImageTooLargeError(f"图片过大: {content_length} 字节 {url}")
+
+        spool = SpooledTemporaryFile(max_size=spool_threshold)
+        sha256 = hashlib.sha256()
+        size = 0
+        # 服务器持续缓慢发送时 read_timeout 不会触发，按总耗时中止
+        deadline = time.monotonic() + transport.download_timeout if transport.download_timeout else None
+        try:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                if deadline is not None and time.monotonic() > deadline:
+                    raise Exception(f"下载图片超时: {url}")
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ImageTooLargeError(f"图片超过 {max_bytes} 字节: {url}")
+                sha256.update(chunk)
+                spool.write(chunk)
+        except BaseException:
+            spool.close()
+            raise
+        spool.seek(0)
+    return DownloadedImage(spool, sha256.hexdigest(), content_type, size)
+
+
+def fetch_image(url, headers=None, max_bytes=DEFAULT_MAX_BYTES):
     """
     Fetches an image from a URL using optional HTTP headers.
 
     Parameters:
     url (str): URL to the image to be fetched.
     headers (dict, optional): HTTP headers to be used in the request.
+    max_bytes (int): Maximum accepted image size.
 
     Returns:
     bytes: The binary content of the image if the request is successful, None otherwise.
     """
     try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()  # Raises HTTPError for bad responses
-        return response.content
-    except requests.RequestException as e:
+        image = download_image(url, headers=headers, max_bytes=max_bytes)
+    except Exception as e:
         print(f"Error fetching image: {e}")
         return None
+    with image.file:
+        return image.file.read()
 
 
 def fetch_wb_image(url):
@@ -0,0 +1,101 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from app.utils import metrics
+
+
+class HedgedRequester:
+    """
+    对冲请求：请求超过最近延迟的 quantile 分位数仍未返回时，再发一个相同的请求，
+    先返回的结果生效，用于降低抓取的长尾延迟。
+
+    - 至少积累 min_samples 个延迟样本后才开始对冲，等待时间不少于 min_delay 秒；
+    - 对冲请求数不超过总请求数的 max_ratio，避免慢的时候请求量翻倍；
+    - 落败的响应在完成后关闭，释放连接。
+    """
+
+    def __init__(
+        self,
+        quantile=0.95,
+        min_delay=0.05,
+        max_ratio=0.05,
+        window=200,
+        min_samples=20,
+        workers=16,
+    ):
+        self.quantile = quantile
+        self.min_delay = min_delay
+        self.max_ratio = max_ratio
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._requests = 0
+        self._hedges = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hedge")
+
+    def delay(self):
+        """当前的对冲等待时间（秒），样本不足时返回 None。"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            samples = sorted(self._samples)
+        index = min(len(samples) - 1, int(len(samples) * self.quantile))
+        return max(self.min_delay, samples[index])
+
+    def _timed(self, func, args, kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        with self._lock:
+            self._samples.append(time.perf_counter() - start)
+        return result
+
+    def _allow_hedge(self):
+        with self._lock:
+            if self._hedges + 1 > self._requests * self.max_ratio:
+                return False
+            self._hedges += 1
+            return True
+
+    def call(self, func, *args, **kwargs):
+        """执行 func(*args, **kwargs)，必要时对冲，返回先成功的结果。"""
+        with self._lock:
+            self._requests += 1
+        delay = self.delay()
+        primary = self._executor.submit(self._timed, func, args, kwargs)
+        if delay is None:
+            return primary.result()
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._allow_hedge():
+            return primary.result()
+
+        hedge = self._executor.submit(self._timed, func, args, kwargs)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                for other in pending:
+                    other.add_done_callback(_close_result)
+                metrics.inc(
+                    "hedged_requests_total",
+                    help="Hedged requests by winner",
+                    winner="primary" if future is primary else "hedge",
+                )
+                return result
+        raise error
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+def _close_result(future):
+    # 落败请求的响应不再使用
+    if future.exception() is None and hasattr(future.result(), "close"):
+        future.result().close()
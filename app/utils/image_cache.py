@@ -0,0 +1,90 @@
+import sqlite3
+import threading
+import time
+
+
+class ImageKeyCache:
+    """
+    持久化的图片 -> 飞书 image_key 缓存。
+
+    同时按微博图片 URL 和图片内容的 SHA-256 索引：URL 命中时无需下载，
+    内容命中时无需上传。超过 ttl 的记录视为失效，条目数超过 max_entries
+    时按最近使用时间淘汰。
+    """
+
+    def __init__(self, path="image_keys.db", ttl=30 * 24 * 3600, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS image_keys ("
+            " url TEXT PRIMARY KEY,"
+            " sha256 TEXT NOT NULL,"
+            " image_key TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_used REAL NOT NULL"
+            ")"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_image_keys_sha256 ON image_keys (sha256)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_image_keys_last_used ON image_keys (last_used)"
+        )
+
+    def _lookup(self, column, value):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT url, image_key FROM image_keys"
+                f" WHERE {column} = ? AND created_at > ?"
+                f" ORDER BY created_at DESC LIMIT 1",
+                (value, now - self.ttl),
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE image_keys SET last_used = ? WHERE url = ?", (now, row[0])
+            )
+        return row[1]
+
+    def get_by_url(self, url):
+        return self._lookup("url", url)
+
+    def get_by_hash(self, sha256):
+        return self._lookup("sha256", sha256)
+
+    def put(self, url, sha256, image_key):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO image_keys"
+                " (url, sha256, image_key, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (url, sha256, image_key, now, now),
+            )
+            self._evict()
+
+    def _evict(self):
+        self._conn.execute(
+            "DELETE FROM image_keys WHERE created_at <= ?", (time.time() - self.ttl,)
+        )
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM image_keys").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM image_keys WHERE url IN ("
+                " SELECT url FROM image_keys ORDER BY last_used LIMIT ?"
+                ")",
+                (count - self.max_entries,),
+            )
+
+    def clear(self):
+        """清空缓存。image_key 只在上传它的应用下有效，更换飞书应用后需要清空。"""
+        with self._lock:
+            self._conn.execute("DELETE FROM image_keys")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,125 @@
+import multiprocessing
+import os
+import shutil
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from tempfile import NamedTemporaryFile, SpooledTemporaryFile
+
+try:
+    # 可选：安装了 Pillow 时才能缩放、重新压缩图片
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# 不处理的类型：GIF 可能是动图，重新编码会丢帧
+SKIP_CONTENT_TYPES = ("image/gif",)
+
+
+def shrink_image(src_path, dst_path, max_dimension, quality):
+    """
+    把 src_path 的图片缩放到长边不超过 max_dimension 并重新编码后写入 dst_path，在进程池中执行。
+
+    通过文件传递图片，进程之间不复制图片数据。
+
+    返回值：
+    - 处理后的字节数，无法处理时返回 None
+    """
+    try:
+        with Image.open(src_path) as img:
+            if img.format == "GIF" or getattr(img, "is_animated", False):
+                # Content-Type 不是 image/gif 的 GIF / 动图，重新编码会丢帧
+                return None
+            img.load()
+            if max(img.size) > max_dimension:
+                img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+            if img.mode in ("RGBA", "LA", "P") and img.format == "PNG":
+                # 透明 PNG 保留透明通道
+                img.save(dst_path, format="PNG", optimize=True)
+            else:
+                if img.mode != "RGB":
+                    img = img.convert("RGB")
+                img.save(dst_path, format="JPEG", quality=quality, optimize=True, progressive=True)
+        return os.path.getsize(dst_path)
+    except Exception:
+        return None
+
+
+class ImageProcessor:
+    """
+    上传前的图片缩放 / 重新压缩。
+
+    超过 min_bytes 的图片在进程池中缩放到长边不超过 max_dimension 并按 quality 重新编码，
+    结果比原图小时才替换。未安装 Pillow 时不做处理。
+    """
+
+    def __init__(self, max_dimension=2048, quality=85, workers=2, min_bytes=256 * 1024):
+        self.max_dimension = max_dimension
+        self.quality = quality
+        self.workers = workers
+        self.min_bytes = min_bytes
+        self._lock = threading.Lock()
+        self._pool = None
+
+    @property
+    def available(self):
+        return Image is not None
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn 避免在多线程进程中 fork
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+
+    def process(self, file, size, content_type, spool_threshold=1024 * 1024):
+        """
+        处理一张已下载的图片。
+
+        参数：
+        - file: 图片文件对象，位于开头
+        - size: 图片字节数
+        - content_type: 图片的 Content-Type
+
+        返回值：
+        - (file, size)：处理后的新文件（由调用方关闭）及其大小；不需要或无法处理时返回 None
+        """
+        if not self.available or size < self.min_bytes or content_type in SKIP_CONTENT_TYPES:
+            return None
+        # 分块复制到临时文件，工作进程按路径读写，内存中不保留整张图片
+        with NamedTemporaryFile(suffix=".src", delete=False) as src:
+            shutil.copyfileobj(file, src)
+        file.seek(0)
+        dst_path = f"{src.name}.out"
+        try:
+            pool = self._get_pool()
+            try:
+                result = pool.submit(
+                    shrink_image, src.name, dst_path, self.max_dimension, self.quality
+                ).result()
+            except BrokenProcessPool:
+                # 工作进程异常退出（如超大图片被 OOM 杀掉），下次处理时重建进程池，本张上传原图
+                with self._lock:
+                    if self._pool is pool:
+                        self._pool = None
+                pool.shutdown(wait=False)
+                return None
+            if result is None or result >= size:
+                return None
+            spool = SpooledTemporaryFile(max_size=spool_threshold)
+            with open(dst_path, "rb") as dst:
+                shutil.copyfileobj(dst, spool)
+            spool.seek(0)
+            return spool, result
+        finally:
+            for path in (src.name, dst_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False)
+                self._pool = None
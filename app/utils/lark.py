@@ -1,43 +1,95 @@
-import requests
-import time
+from concurrent.futures import ThreadPoolExecutor
 
-from tenacity import retry, stop_after_attempt, wait_fixed
+from tenacity import (
+    retry,
+    retry_if_not_exception_type,
+    stop_after_attempt,
+    wait_random_exponential,
+)
+
+from app.utils import metrics
+from app.utils.circuit import CircuitOpenError
+from app.utils.get_wb_pic import (
+    DEFAULT_MAX_BYTES,
+    DEFAULT_SPOOL_THRESHOLD,
+    ImageRejectedError,
+    ImageTooLargeError,
+    download_image,
+)
+from app.utils.multipart import MultipartStream
+from app.utils.token_cache import TokenCache
+from app.utils.transport import get_transport
+from app.utils.weibo import image_variants
+
+
+# 飞书开放平台接口地址，测试或私有化部署时可通过 api_base 覆盖
+DEFAULT_API_BASE = "https://open.feishu.cn/open-apis"
 
 
 class LarkClient:
-    def __init__(self, app_id, app_secret):
+    def __init__(
+        self,
+        app_id,
+        app_secret,
+        transport=None,
+        image_cache=None,
+        upload_workers=4,
+        max_image_bytes=DEFAULT_MAX_BYTES,
+        spool_threshold=DEFAULT_SPOOL_THRESHOLD,
+        token_cache_path=None,
+        api_base=DEFAULT_API_BASE,
+        image_processor=None,
+        image_budget=0,
+    ):
         self.app_id = app_id
         self.app_secret = app_secret
-        self.token_info = {
-            "tenant_access_token": None,
-            "expire_time": 0,  # Token 过期的时间戳
-        }
+        self.api_base = api_base.rstrip("/")
+        self._transport = transport
+        # 图片 URL / 内容哈希 -> image_key 的持久缓存，为 None 时不缓存
+        self.image_cache = image_cache
+        # 同一条博文的图片并发上传数
+        self.upload_workers = upload_workers
+        # 单张图片大小上限，以及下载时超过多少字节落盘
+        self.max_image_bytes = max_image_bytes
+        self.spool_threshold = spool_threshold
+        # 上传前缩放 / 重新压缩图片的 ImageProcessor，为 None 时原样上传
+        self.image_processor = image_processor
+        # 单张图片的字节预算，原图超出时依次改用 bmiddle、orj360 等更小的尺寸，0 表示不限
+        self.image_budget = image_budget
+        # token_cache_path 为多个进程共享的 token 文件，为 None 时只在进程内缓存
+        self.token_cache = TokenCache(
+            self._request_tenant_access_token, path=token_cache_path, key=app_id
+        )
+
+    def close(self):
+        """停止 token 后台刷新。"""
+        self.token_cache.close()
+
+    @property
+    def transport(self):
+        # 未显式传入时使用全局共享的传输层
+        return self._transport or get_transport()
 
     # 使用装饰器
-    @retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
+    @retry(
+        stop=stop_after_attempt(3),
+        wait=wait_random_exponential(multiplier=1, max=10),
+        before_sleep=metrics.retry_counter("lark_token"),
+    )
     def get_tenant_access_token(self):
-        current_time = time.time()
-        if (
-            self.token_info["tenant_access_token"] is None
-            or current_time >= self.token_info["expire_time"]
-        ):
-            # 如果 Token 不存在或已过期，重新获取
-            url = (
-                "https://open.feishu.cn/open-apis/auth/v3/tenant_access_token/internal/"
-            )
-            headers = {"Content-Type": "application/json; charset=utf-8"}
-            data = {"app_id": self.app_id, "app_secret": self.app_secret}
-            response = requests.post(url, json=data, headers=headers)
-            res_data = response.json()
-            print(res_data)
-            if res_data.get("code") == 0:
-                self.token_info["tenant_access_token"] = res_data["tenant_access_token"]
-                expires_in = res_data["expire"]  # Token 有效期（秒）
-                # 设置过期时间，留出 60 秒的缓冲
-                self.token_info["expire_time"] = current_time + expires_in - 60
-            else:
-                raise Exception(f"获取 Token 失败: {res_data.get('msg')}")
-        return self.token_info["tenant_access_token"]
+        return self.token_cache.get()
+
+    def _request_tenant_access_token(self):
+        """请求新的 tenant_access_token，返回 (token, 有效期秒数)。"""
+        url = f"{self.api_base}/auth/v3/tenant_access_token/internal/"
+        headers = {"Content-Type": "application/json; charset=utf-8"}
+        data = {"app_id": self.app_id, "app_secret": self.app_secret}
+        response = self.transport.post(url, json=data, headers=headers)
+        res_data = response.json()
+        if res_data.get("code") == 0:
+            return res_data["tenant_access_token"], res_data["expire"]
+        else:
+            raise Exception(f"获取 Token 失败: {res_data.get('msg')}")
 
     def upload_images_from_urls(self, image_urls, image_type="message"):
         """
@@ -48,19 +100,38 @@ class LarkClient:
         - image_type: 图片类型，默认为 'message'
 
         返回值：
-        - image_keys: 成功上传的图片的 image_key 列表
+        - image_keys: 成功上传的图片的 image_key 列表，被拒绝的图片（类型不符、过大）会被跳过
         """
-        image_keys = []
+        if not self.app_id or not image_urls:
+            return []
 
-        if not self.app_id:
-            return image_keys
+        def upload(url):
+            try:
+                return self.upload_image_from_url(url, image_type)
+            except ImageRejectedError as e:
+                metrics.inc(
+                    "lark_image_rejected_total",
+                    help="Images skipped as non-image or too large",
+                    reason=type(e).__name__,
+                )
+                return None
 
-        for url in image_urls:
-            image_key = self.upload_image_from_url(url, image_type)
-            image_keys.append(image_key)
-        return image_keys
+        if len(image_urls) == 1 or self.upload_workers <= 1:
+            image_keys = [upload(url) for url in image_urls]
+        else:
+            # 并发下载上传，map 按输入顺序返回结果
+            workers = min(self.upload_workers, len(image_urls))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                image_keys = list(executor.map(upload, image_urls))
+        return [image_key for image_key in image_keys if image_key]
 
-    @retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
+    @retry(
+        stop=stop_after_attempt(3),
+        wait=wait_random_exponential(multiplier=1, max=10),
+        # 图片被拒或主机熔断中，重试也不会成功
+        retry=retry_if_not_exception_type((ImageRejectedError, CircuitOpenError)),
+        before_sleep=metrics.retry_counter("lark_image_upload"),
+    )
     def upload_image_from_url(self, image_url, image_type="message"):
         """
         通过图片 URL 上传图片，获取 image_key。
@@ -69,26 +140,87 @@ class LarkClient:
         :param image_type: 图片类型，可选值为 "message", "avatar", "group_avatar"
         :return: image_key
         """
-        # 下载图片
-        response = requests.get(image_url)
-        if response.status_code != 200:
-            raise Exception(f"无法下载图片，状态码: {response.status_code}")
+        if self.image_cache is not None:
+            image_key = self.image_cache.get_by_url(image_url)
+            if image_key:
+                metrics.inc("lark_image_cache_total", result="url_hit")
+                return image_key
 
-        token = self.get_tenant_access_token()
-        url = "https://open.feishu.cn/open-apis/im/v1/images"
-        headers = {"Authorization": f"Bearer {token}"}
-        files = {
-            "image_type": (None, image_type),
-            "image": ("image", response.content, "application/octet-stream"),
-        }
-        response = requests.post(url, headers=headers, files=files)
+        image = self._download(image_url)
+        metrics.inc("lark_image_download_bytes_total", image.size)
+        with image.file:
+            if self.image_cache is not None:
+                # 内容相同的图片（如转发）直接复用已上传的 image_key
+                image_key = self.image_cache.get_by_hash(image.sha256)
+                if image_key:
+                    metrics.inc("lark_image_cache_total", result="hash_hit")
+                    self.image_cache.put(image_url, image.sha256, image_key)
+                    return image_key
+                metrics.inc("lark_image_cache_total", result="miss")
+
+            file, size = image.file, image.size
+            if self.image_processor is not None:
+                with metrics.timer("lark_image_process_seconds", help="Image resize latency"):
+                    processed = self.image_processor.process(
+                        image.file, image.size, image.content_type, self.spool_threshold
+                    )
+                if processed is not None:
+                    file, size = processed
+                    metrics.inc("lark_image_saved_bytes_total", image.size - size)
+
+            with file:
+                token = self.get_tenant_access_token()
+                url = f"{self.api_base}/im/v1/images"
+                body = MultipartStream(
+                    fields=[("image_type", image_type)],
+                    file_field="image",
+                    filename="image",
+                    file_obj=file,
+                    file_size=size,
+                    file_type="application/octet-stream",
+                )
+                headers = {
+                    "Authorization": f"Bearer {token}",
+                    "Content-Type": body.content_type,
+                }
+                with metrics.timer("lark_image_upload_seconds", help="Image upload latency"):
+                    response = self.transport.post(url, headers=headers, data=body)
         res_data = response.json()
+        metrics.inc("lark_image_upload_total", code=res_data.get("code"))
         if res_data.get("code") == 0:
             image_key = res_data["data"]["image_key"]
+            if self.image_cache is not None:
+                self.image_cache.put(image_url, image.sha256, image_key)
             return image_key
         else:
             raise Exception(f"上传图片失败: {res_data.get('msg')}")
 
+    def _download(self, image_url):
+        """
+        流式下载到内存/临时文件，边下载边计算哈希。
+
+        设置了 image_budget 时，超出预算的图片依次改用更小的微博尺寸，
+        最小的尺寸只受 max_image_bytes 限制。
+        """
+        candidates = image_variants(image_url) if self.image_budget else [image_url]
+        for index, candidate in enumerate(candidates):
+            last = index == len(candidates) - 1
+            max_bytes = self.max_image_bytes
+            if not last:
+                max_bytes = min(self.image_budget, self.max_image_bytes)
+            try:
+                with metrics.timer("lark_image_download_seconds", help="Image download latency"):
+                    return download_image(
+                        candidate,
+                        max_bytes=max_bytes,
+                        spool_threshold=self.spool_threshold,
+                        transport=self.transport,
+                    )
+            except ImageTooLargeError:
+                if last:
+                    raise
+                metrics.inc("lark_image_fallback_total", help="Downloads retried at a smaller size")
+
     def upload_image(
         self,
         image_path  # The `, image_type='message'` in the
@@ -105,13 +237,13 @@ class LarkClient:
         :return: image_key
         """
         token = self.get_tenant_access_token()
-        url = "https://open.feishu.cn/open-apis/im/v1/images"
+        url = f"{self.api_base}/im/v1/images"
         headers = {"Authorization": f"Bearer {token}"}
         files = {
             "image_type": (None, image_type),
             "image": ("image.jpg", open(image_path, "rb"), "image/jpeg"),
         }
-        response = requests.post(url, headers=headers, files=files)
+        response = self.transport.post(url, headers=headers, files=files)
         res_data = response.json()
         if res_data.get("code") == 0:
             image_key = res_data["data"]["image_key"]
@@ -127,9 +259,9 @@ class LarkClient:
         :return: 图片信息的字典
         """
         token = self.get_tenant_access_token()
-        url = f"https://open.feishu.cn/open-apis/im/v1/images/{image_key}"
+        url = f"{self.api_base}/im/v1/images/{image_key}"
         headers = {"Authorization": f"Bearer {token}"}
-        response = requests.get(url, headers=headers)
+        response = self.transport.get(url, headers=headers)
         res_data = response.json()
         if res_data.get("code") == 0:
             return res_data["data"]
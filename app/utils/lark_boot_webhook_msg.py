@@ -4,12 +4,23 @@ import time
 import hashlib
 import hmac
 import base64
-from tenacity import retry, stop_after_attempt, wait_fixed
+from tenacity import retry, stop_after_attempt, wait_random_exponential
 import yaml
 
+from app.utils import metrics
+from app.utils.transport import get_transport
+
 
 demo_webhook_url = "https://open.feishu.cn/open-apis/bot/v2/hook/your_webhook_url_here"
 
+# 飞书自定义机器人的限流错误码：9499 请求过多，11232 发送频率超限
+RATE_LIMIT_CODES = (9499, 11232)
+
+
+def is_rate_limited(rsp):
+    """send_card_msg 的返回值是否表示被飞书限流。"""
+    return bool(rsp) and rsp.get("code") in RATE_LIMIT_CODES
+
 
 def handle_request_exception(err):
     """根据不同的异常类型返回相应的错误代码和消息"""
@@ -25,9 +36,15 @@ def handle_request_exception(err):
 
 
 class LarkBot:
-    def __init__(self, webhook_url, webhook_secret=None):
+    def __init__(self, webhook_url, webhook_secret=None, transport=None):
         self.webhook_url = webhook_url
         self.webhook_secret = webhook_secret
+        self._transport = transport
+
+    @property
+    def transport(self):
+        # 未显式传入时使用全局共享的传输层
+        return self._transport or get_transport()
 
     def send_msg(self, title, body):
         card = build_card_message(title, body)
@@ -39,23 +56,50 @@ class LarkBot:
 
         return rsp
     
-    @retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
+    @retry(
+        stop=stop_after_attempt(3),
+        wait=wait_random_exponential(multiplier=1, max=10),
+        before_sleep=metrics.retry_counter("lark_send"),
+    )
     def send_card_msg(self, card):
         """通过飞书Webhook发送卡片消息，支持签名校验。"""
+        with metrics.timer("lark_send_seconds", help="Webhook send latency"):
+            rsp = self._post_card(card)
+        metrics.inc("lark_send_total", help="Webhook sends by result code", code=rsp["code"])
+        return rsp
 
+    def _post_card(self, card):
+        """card 可以是卡片字典，也可以是 dump_card 序列化好的 JSON 字符串。"""
         timestamp = str(int(time.time()))
         headers = {"Content-Type": "application/json"}
-        data = {"timestamp": timestamp, "msg_type": "interactive", "card": card}
+        data = {"timestamp": timestamp, "msg_type": "interactive"}
 
         if self.webhook_secret:
             data["sign"] = gen_sign(timestamp=timestamp, secret=self.webhook_secret)
 
+        # 只有时间戳和签名因目标而异，卡片正文直接拼接，不重复序列化
+        card_json = card if isinstance(card, str) else dump_card(card)
+        body = f'{json.dumps(data)[:-1]}, "card": {card_json}}}'
+
         try:
-            response = requests.post(self.webhook_url, headers=headers, json=data)
+            response = self.transport.post(
+                self.webhook_url, headers=headers, data=body.encode("utf-8")
+            )
+            if response.status_code == 429:
+                return {"code": RATE_LIMIT_CODES[0], "msg": "too many requests"}
             response.raise_for_status()  # 触发HTTPError，如果状态不是200
         except requests.exceptions.RequestException as err:
             return handle_request_exception(err)
-        
+
+        # 飞书在 HTTP 200 中通过 code（旧版为 StatusCode）返回业务错误，如限流、签名校验失败
+        try:
+            res_data = response.json()
+        except ValueError:
+            return {"code": 0, "msg": ""}
+        code = res_data.get("code", res_data.get("StatusCode", 0))
+        msg = res_data.get("msg", res_data.get("StatusMessage", ""))
+        if code:
+            return {"code": code, "msg": msg}
         return {"code": 0, "msg": ""}
 
 
@@ -70,6 +114,11 @@ def gen_sign(timestamp, secret):
     return sign
 
 
+def dump_card(card):
+    """把卡片序列化为 JSON 字符串，同一张卡片发给多个目标时只序列化一次。"""
+    return json.dumps(card, ensure_ascii=False)
+
+
 def build_card_message(title, text, image_keys=None):
     """
     构建卡片消息的内容。
@@ -0,0 +1,162 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 默认延迟直方图分桶（秒）
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(label_key, extra=()):
+    pairs = list(label_key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Registry:
+    """进程内的计数器和直方图，按 Prometheus 文本格式导出。"""
+
+    def __init__(self, per_user=False):
+        # 是否按用户打标签，用户很多时关闭以控制时间序列数量
+        self.per_user = per_user
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._buckets = {}
+        self._help = {}
+
+    def user_labels(self, user_id):
+        return {"user_id": user_id} if self.per_user else {}
+
+    def inc(self, name, value=1, help=None, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            if help:
+                self._help.setdefault(name, help)
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS, help=None, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            if help:
+                self._help.setdefault(name, help)
+            buckets = self._buckets.setdefault(name, tuple(buckets))
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(len(buckets))
+            index = bisect.bisect_left(buckets, value)
+            if index < len(buckets):
+                histogram.counts[index] += 1
+            histogram.sum += value
+            histogram.count += 1
+
+    @contextmanager
+    def timer(self, name, help=None, **labels):
+        """记录 with 块的耗时（秒）到直方图 name。"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, help=help, **labels)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                buckets = self._buckets[name]
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in series.items():
+                    cumulative = 0
+                    for bound, count in zip(buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(
+                            f"{name}_bucket{_format_labels(key, [('le', repr(float(bound)))])} {cumulative}"
+                        )
+                    lines.append(
+                        f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {histogram.count}"
+                    )
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+# 全局默认注册表
+registry = Registry()
+
+
+def inc(name, value=1, help=None, **labels):
+    registry.inc(name, value, help=help, **labels)
+
+
+def observe(name, value, help=None, **labels):
+    registry.observe(name, value, help=help, **labels)
+
+
+def timer(name, help=None, **labels):
+    return registry.timer(name, help=help, **labels)
+
+
+def user_labels(user_id):
+    return registry.user_labels(user_id)
+
+
+def retry_counter(stage):
+    """生成 tenacity 的 before_sleep 回调，每次重试计数一次。"""
+
+    def before_sleep(retry_state):
+        inc("retries_total", help="Retries by stage", stage=stage)
+
+    return before_sleep
+
+
+def start_http_server(port, host="127.0.0.1"):
+    """在后台线程中启动 /metrics 端点，返回 server 对象。"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
@@ -0,0 +1,62 @@
+import uuid
+
+
+class MultipartStream:
+    """
+    按需生成 multipart/form-data 请求体的只读文件对象。
+
+    requests 对 files= 参数会把整个文件读入内存再编码，这里改为边读边发：
+    文件部分直接从文件对象分块读取，内存占用与图片大小无关。
+    提供 __len__，requests 会据此设置 Content-Length 而不是分块传输。
+    """
+
+    def __init__(self, fields, file_field, filename, file_obj, file_size, file_type):
+        self.boundary = uuid.uuid4().hex
+        head = b"".join(
+            self._part_header(name) + str(value).encode("utf-8") + b"\r\n"
+            for name, value in fields
+        )
+        head += self._part_header(file_field, filename, file_type)
+        self._head = head
+        self._tail = f"\r\n--{self.boundary}--\r\n".encode("utf-8")
+        self._file = file_obj
+        self._length = len(self._head) + file_size + len(self._tail)
+        self._stage = 0
+        self._offset = 0
+
+    def _part_header(self, name, filename=None, content_type=None):
+        disposition = f'form-data; name="{name}"'
+        if filename is not None:
+            disposition += f'; filename="{filename}"'
+        header = f"--{self.boundary}\r\nContent-Disposition: {disposition}\r\n"
+        if content_type:
+            header += f"Content-Type: {content_type}\r\n"
+        return (header + "\r\n").encode("utf-8")
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self._length
+        chunks = []
+        while size > 0 and self._stage < 3:
+            if self._stage == 1:
+                data = self._file.read(size)
+                if not data:
+                    self._stage, self._offset = 2, 0
+                    continue
+            else:
+                buffer = self._head if self._stage == 0 else self._tail
+                data = buffer[self._offset : self._offset + size]
+                self._offset += len(data)
+                if self._offset >= len(buffer):
+                    self._stage, self._offset = self._stage + 1, 0
+            chunks.append(data)
+            size -= len(data)
+        return b"".join(chunks)
+
@@ -0,0 +1,141 @@
+import json
+import sqlite3
+import threading
+import time
+
+from app.utils.weibo import Post
+
+# 博文在发件箱中的状态
+FETCHED = "fetched"  # 已抓取，图片未上传
+UPLOADED = "uploaded"  # 图片已上传，卡片未发送
+SENT = "sent"  # 已发送
+FAILED = "failed"  # 多次发送失败，不再自动重试
+
+
+class Outbox:
+    """
+    持久化的发件箱，逐条记录每条博文的处理进度。
+
+    每一步（抓取、上传图片、发送）完成后立即提交，进程重启或本轮异常后，
+    未完成的博文从中断的步骤继续，不必重新抓取和上传。
+    博文推送到多个目标时，逐个记录已送达的目标，重试时只发给剩下的目标。
+    """
+
+    def __init__(self, path="outbox.db", max_attempts=5, retention=24 * 3600):
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " user_id TEXT NOT NULL,"
+            " post_id TEXT NOT NULL,"
+            " state TEXT NOT NULL,"
+            " post TEXT NOT NULL,"
+            " image_keys TEXT,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " updated_at REAL NOT NULL,"
+            " delivered TEXT,"
+            " PRIMARY KEY (user_id, post_id)"
+            ")"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(outbox)")}
+        if "delivered" not in columns:
+            # 旧版发件箱没有记录已送达的目标
+            self._conn.execute("ALTER TABLE outbox ADD COLUMN delivered TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_state ON outbox (state)")
+        # 清理早已发送完成的记录
+        self._conn.execute(
+            "DELETE FROM outbox WHERE state = ? AND updated_at < ?",
+            (SENT, time.time() - retention),
+        )
+
+    def _update(self, user_id, post_id, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE outbox SET {assignments} WHERE user_id = ? AND post_id = ?",
+                (*fields.values(), user_id, post_id),
+            )
+
+    def add_fetched(self, user_id, post):
+        """记录新抓取到的博文，已存在的记录保持原状态。"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO outbox (user_id, post_id, state, post, updated_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (user_id, post.id, FETCHED, json.dumps(post.to_dict(), ensure_ascii=False), time.time()),
+            )
+
+    def get(self, user_id, post_id):
+        """返回 (state, image_keys)，不存在时返回 (None, None)。"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state, image_keys FROM outbox WHERE user_id = ? AND post_id = ?",
+                (user_id, post_id),
+            ).fetchone()
+        if row is None:
+            return None, None
+        return row[0], json.loads(row[1]) if row[1] is not None else None
+
+    def mark_uploaded(self, user_id, post_id, image_keys):
+        self._update(user_id, post_id, state=UPLOADED, image_keys=json.dumps(image_keys))
+
+    def delivered(self, user_id, post_id):
+        """已送达的目标名称集合。"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT delivered FROM outbox WHERE user_id = ? AND post_id = ?",
+                (user_id, post_id),
+            ).fetchone()
+        if row is None or row[0] is None:
+            return set()
+        return set(json.loads(row[0]))
+
+    def mark_delivered(self, user_id, post_id, target):
+        """记录博文已送达 target，返回已送达的目标名称集合。"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT delivered FROM outbox WHERE user_id = ? AND post_id = ?",
+                (user_id, post_id),
+            ).fetchone()
+            delivered = set(json.loads(row[0])) if row and row[0] else set()
+            delivered.add(target)
+            self._conn.execute(
+                "UPDATE outbox SET delivered = ?, updated_at = ? WHERE user_id = ? AND post_id = ?",
+                (json.dumps(sorted(delivered)), time.time(), user_id, post_id),
+            )
+        return delivered
+
+    def mark_sent(self, user_id, post_id):
+        self._update(user_id, post_id, state=SENT)
+
+    def mark_failed(self, user_id, post_id):
+        """记录一次失败，超过 max_attempts 次后不再自动重试。"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE outbox SET attempts = attempts + 1,"
+                " state = CASE WHEN attempts + 1 >= ? THEN ? ELSE state END,"
+                " updated_at = ?"
+                " WHERE user_id = ? AND post_id = ?",
+                (self.max_attempts, FAILED, time.time(), user_id, post_id),
+            )
+
+    def pending(self, user_ids=None):
+        """未完成的博文，返回 (user_id, post) 列表，按用户和博文ID排序。"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT user_id, post FROM outbox WHERE state IN (?, ?)"
+                " ORDER BY user_id, CAST(post_id AS INTEGER)",
+                (FETCHED, UPLOADED),
+            ).fetchall()
+        if user_ids is not None:
+            user_ids = set(user_ids)
+            rows = [row for row in rows if row[0] in user_ids]
+        return [(user_id, Post.from_dict(json.loads(post))) for user_id, post in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,172 @@
+import itertools
+import threading
+import time
+
+from app.utils import metrics
+from app.utils.circuit import CircuitBreaker
+from app.utils.transport import Transport
+
+# 未配置 user_agents 时使用的移动端 User-Agent
+DEFAULT_USER_AGENT = (
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15"
+    " (KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1"
+)
+
+STRATEGIES = ("round_robin", "least_throttled")
+
+
+def parse_cookie(cookie):
+    """把浏览器复制的 Cookie 字符串（如 "SUB=...; SUBP=..."）解析为字典。"""
+    cookies = {}
+    for part in cookie.split(";"):
+        name, sep, value = part.strip().partition("=")
+        if sep and name:
+            cookies[name] = value
+    return cookies
+
+
+class WeiboSession:
+    """
+    一个微博会话：独立的 Cookie、User-Agent、连接池和熔断器。
+
+    访客会话（cookie 为 None）首次使用时访问一次首页领取访客 Cookie；
+    登录会话使用配置中的 Cookie，不会自动刷新。
+    """
+
+    def __init__(self, name, user_agent, breaker, cookie=None, transport_options=None):
+        self.name = name
+        self.user_agent = user_agent
+        self.breaker = breaker
+        self.cookie = cookie
+        options = dict(transport_options or {})
+        headers = dict(options.pop("headers", None) or {})
+        headers.setdefault("User-Agent", user_agent)
+        self.transport = Transport(headers=headers, **options)
+        if cookie:
+            for key, value in parse_cookie(cookie).items():
+                self.transport.session.cookies.set(key, value)
+        self.created_at = time.monotonic()
+        self.last_used = 0.0
+        self.last_throttled = 0.0
+        # 连续被限流的次数，成功一次即清零
+        self.throttles = 0
+        self._prepared = cookie is not None
+        self._lock = threading.Lock()
+
+    @property
+    def is_visitor(self):
+        return self.cookie is None
+
+    def prepare(self, home_url):
+        """访客会话首次使用前访问首页领取 Cookie，失败时以匿名身份继续。"""
+        if self._prepared:
+            return
+        with self._lock:
+            if self._prepared:
+                return
+            try:
+                self.transport.get(home_url).close()
+            except Exception:
+                pass
+            self._prepared = True
+
+    def close(self):
+        self.transport.close()
+
+
+class SessionPool:
+    """
+    微博会话池。
+
+    每次请求选择一个会话：round_robin 轮流使用，least_throttled 优先使用最久没有被限流的会话；
+    熔断中或排队等待的会话排在可以立即请求的会话之后。每个会话单独熔断、单独限速，
+    请求能力随会话数增长。访客会话连续被限流 max_failures 次或使用超过 max_age 秒后
+    换成新的访客身份（保留熔断器的退避状态）；登录会话只依靠熔断器退避。
+    """
+
+    def __init__(
+        self,
+        visitors=1,
+        cookies=(),
+        strategy="least_throttled",
+        user_agents=(),
+        max_failures=3,
+        max_age=3600,
+        transport_options=None,
+        breaker_options=None,
+        host="m.weibo.cn",
+    ):
+        if strategy not in STRATEGIES:
+            raise Exception(f"weibo_sessions.strategy 只能是 {' 或 '.join(STRATEGIES)}: {strategy}")
+        if not visitors and not cookies:
+            raise Exception("weibo_sessions 至少需要一个访客会话或登录 Cookie")
+        self.strategy = strategy
+        self.max_failures = max_failures
+        self.max_age = max_age
+        self.host = host
+        self.transport_options = transport_options or {}
+        self.breaker_options = breaker_options or {}
+        self._user_agents = itertools.cycle(list(user_agents) or [DEFAULT_USER_AGENT])
+        self._lock = threading.Lock()
+        self._next = 0
+        self.sessions = [
+            self._new_session(f"login{i}", cookie=cookie) for i, cookie in enumerate(cookies)
+        ]
+        self.sessions += [self._new_session(f"visitor{i}") for i in range(visitors)]
+
+    def _new_session(self, name, cookie=None, breaker=None):
+        if breaker is None:
+            breaker = CircuitBreaker(f"{self.host}#{name}", **self.breaker_options)
+        return WeiboSession(
+            name, next(self._user_agents), breaker, cookie, self.transport_options
+        )
+
+    def acquire(self):
+        """选出本次请求使用的会话，过期的访客会话先换新。"""
+        with self._lock:
+            now = time.monotonic()
+            for index, session in enumerate(self.sessions):
+                if session.is_visitor and self.max_age and now - session.created_at > self.max_age:
+                    self._replace(index, "expired")
+            waits = [session.breaker.retry_after() for session in self.sessions]
+            if self.strategy == "round_robin":
+                order = [(i + self._next) % len(self.sessions) for i in range(len(self.sessions))]
+                index = min(order, key=lambda i: waits[i])
+                self._next = (index + 1) % len(self.sessions)
+            else:
+                index = min(
+                    range(len(self.sessions)),
+                    key=lambda i: (
+                        waits[i],
+                        self.sessions[i].last_throttled,
+                        self.sessions[i].last_used,
+                    ),
+                )
+            session = self.sessions[index]
+            session.last_used = now
+            return session
+
+    def report_success(self, session):
+        session.throttles = 0
+
+    def report_throttled(self, session):
+        """记录会话被限流，访客会话连续被限流过多时换新。"""
+        with self._lock:
+            session.last_throttled = time.monotonic()
+            session.throttles += 1
+            if session.is_visitor and session.throttles >= self.max_failures:
+                if session in self.sessions:
+                    self._replace(self.sessions.index(session), "throttled")
+
+    def _replace(self, index, reason):
+        old = self.sessions[index]
+        new = self._new_session(old.name, breaker=old.breaker)
+        new.last_throttled = old.last_throttled
+        self.sessions[index] = new
+        # 旧会话可能仍有进行中的请求，连接随对象回收释放
+        metrics.inc("weibo_session_refresh_total", help="Visitor sessions replaced", reason=reason)
+
+    def close(self):
+        with self._lock:
+            for session in self.sessions:
+                session.close()
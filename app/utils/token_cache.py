@@ -0,0 +1,120 @@
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，只做进程内的单飞
+    fcntl = None
+
+
+class TokenCache:
+    """
+    tenant_access_token 缓存。
+
+    - 进程内：加锁单飞，并发请求只会触发一次刷新；
+    - 跨进程：token 写入共享文件，刷新时持有文件锁，其他进程直接读取结果；
+    - 后台线程在过期前 refresh_margin 秒主动刷新，请求路径不等待取 token。
+
+    fetch 为实际请求 token 的函数，返回 (token, expires_in)。
+    key 标识 token 所属的应用（如 app_id），共享文件中 key 不一致的 token 会被忽略。
+    """
+
+    def __init__(self, fetch, path=None, refresh_margin=300, expire_margin=60, key=None):
+        self.fetch = fetch
+        self.path = path
+        self.key = key
+        self.refresh_margin = refresh_margin
+        # 距过期不足 expire_margin 秒的 token 视为已过期
+        self.expire_margin = expire_margin
+        self._token = None
+        self._expire_time = 0
+        self._lock = threading.Lock()
+        self._refresher = None
+        self._closed = threading.Event()
+
+    def _valid(self, margin):
+        return self._token is not None and time.time() < self._expire_time - margin
+
+    def get(self):
+        """获取有效的 token，必要时刷新。"""
+        if not self._valid(self.expire_margin):
+            with self._lock:
+                if not self._valid(self.expire_margin):
+                    self._refresh(self.expire_margin)
+        self._start_refresher()
+        return self._token
+
+    def _refresh(self, margin):
+        """在持有 self._lock 的情况下刷新：先看共享文件，仍不满足 margin 时才请求接口。"""
+        if self.path is None:
+            self._fetch()
+            return
+        with open(f"{self.path}.lock", "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._load()
+                if not self._valid(margin):
+                    self._fetch()
+                    self._save()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _fetch(self):
+        token, expires_in = self.fetch()
+        self._token = token
+        self._expire_time = time.time() + expires_in
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("key") != self.key:
+            # 换了应用凭据，旧 token 不能再用
+            return
+        if data.get("expire_time", 0) > self._expire_time:
+            self._token = data.get("token")
+            self._expire_time = data["expire_time"]
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"key": self.key, "token": self._token, "expire_time": self._expire_time}, f)
+        os.replace(tmp_path, self.path)
+
+    def _start_refresher(self):
+        if self._refresher is not None:
+            return
+        with self._lock:
+            if self._refresher is None:
+                self._refresher = threading.Thread(
+                    target=self._refresh_loop, name="lark-token-refresh", daemon=True
+                )
+                self._refresher.start()
+
+    def close(self):
+        """停止后台刷新线程，凭据更换后旧的缓存不再续期。"""
+        self._closed.set()
+
+    def _refresh_loop(self):
+        while not self._closed.is_set():
+            wait = self._expire_time - self.refresh_margin - time.time()
+            if wait > 0:
+                self._closed.wait(wait)
+                continue
+            try:
+                with self._lock:
+                    self._refresh(self.refresh_margin)
+            except Exception:
+                # 主动刷新失败不影响请求路径，稍后重试
+                self._closed.wait(30)
+                continue
+            if not self._valid(self.refresh_margin):
+                # 接口在有效期较长时会返回旧 token，避免忙等
+                self._closed.wait(30)
@@ -0,0 +1,100 @@
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# 各主机默认的连接池大小，未列出的主机使用 pool_maxsize
+DEFAULT_HOST_POOLS = {
+    "m.weibo.cn": 20,
+    "wx1.sinaimg.cn": 20,
+    "wx2.sinaimg.cn": 20,
+    "wx3.sinaimg.cn": 20,
+    "wx4.sinaimg.cn": 20,
+    "open.feishu.cn": 20,
+}
+
+
+class Transport:
+    """
+    共享的 HTTP 传输层。
+
+    所有客户端通过同一个 Session 发请求，按主机维护 keep-alive 连接池，
+    统一设置超时、gzip 以及请求头。read_timeout 只限制两次读取之间的间隔，
+    流式下载另由 download_timeout 限制总耗时。
+    """
+
+    def __init__(
+        self,
+        pool_connections=10,
+        pool_maxsize=10,
+        connect_timeout=5,
+        read_timeout=15,
+        download_timeout=60,
+        headers=None,
+        host_headers=None,
+        host_pools=None,
+    ):
+        self.timeout = (connect_timeout, read_timeout)
+        self.download_timeout = download_timeout
+        self.host_headers = host_headers or {}
+        self.session = requests.Session()
+        self.session.headers.update({"Accept-Encoding": "gzip, deflate"})
+        if headers:
+            self.session.headers.update(headers)
+
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections, pool_maxsize=pool_maxsize
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        pools = dict(DEFAULT_HOST_POOLS)
+        pools.update(host_pools or {})
+        for host, size in pools.items():
+            # 每个主机单独一个适配器，连接池大小可分别配置
+            self.session.mount(
+                f"https://{host}", HTTPAdapter(pool_connections=1, pool_maxsize=size)
+            )
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        extra_headers = self.host_headers.get(urlsplit(url).hostname)
+        if extra_headers:
+            headers = dict(extra_headers)
+            headers.update(kwargs.get("headers") or {})
+            kwargs["headers"] = headers
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+_lock = threading.Lock()
+_default_transport = None
+
+
+def configure(**options):
+    """按配置（config.yml 中的 http 段）重建默认传输层。"""
+    global _default_transport
+    with _lock:
+        old = _default_transport
+        _default_transport = Transport(**options)
+    if old is not None:
+        old.close()
+    return _default_transport
+
+
+def get_transport():
+    """获取默认传输层，未配置时使用默认参数创建。"""
+    global _default_transport
+    with _lock:
+        if _default_transport is None:
+            _default_transport = Transport()
+        return _default_transport
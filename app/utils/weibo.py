@@ -0,0 +1,151 @@
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+
+from app.utils.extract import get_nested_data
+
+try:
+    # 可选：安装了 orjson 时用它解析 getIndex 响应，速度更快、分配更少
+    import orjson
+
+    def loads(content):
+        return orjson.loads(content)
+
+except ImportError:
+    import json
+
+    def loads(content):
+        return json.loads(content)
+
+
+# getIndex 中博文卡片的 card_type
+POST_CARD_TYPE = 9
+
+# 图片超过字节预算时依次尝试的更小尺寸，对应 URL 中 /large/ 所在的路径段
+IMAGE_FALLBACK_SIZES = ("bmiddle", "orj360")
+
+# 微博限流时返回的状态码：403 拒绝访问，418 反爬拦截，429 请求过多
+THROTTLE_STATUS_CODES = (403, 418, 429)
+
+
+@dataclass(slots=True)
+class Post:
+    """一条微博博文，只保留推送需要的字段。"""
+
+    id: str
+    text: str
+    username: str
+    link: str
+    image_urls: list = field(default_factory=list)
+    created_at: float = None  # 发布时间戳，无法解析时为 None
+
+    def to_dict(self):
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+def parse_created_at(created_at):
+    """把微博的 created_at（如 "Sat Oct 12 10:00:00 +0800 2024"）转换为时间戳，无法解析时返回 None。"""
+    if not created_at:
+        return None
+    try:
+        return datetime.strptime(created_at, "%a %b %d %H:%M:%S %z %Y").timestamp()
+    except ValueError:
+        return None
+
+
+def parse_post_id(post_id):
+    """微博博文ID为递增的数字字符串，转换为整数便于比较新旧，无法转换时返回 None。"""
+    try:
+        return int(post_id)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_post(card, default_link):
+    """把一张 card_type == 9 的卡片解析为 Post。"""
+    mblog = card["mblog"]
+    # 清理文本，移除HTML标签
+    # soup = BeautifulSoup(text, "html.parser")
+    # plain_text = soup.get_text()
+    pics = mblog.get("pics")
+    return Post(
+        id=mblog.get("id"),
+        text=mblog.get("text"),
+        username=get_nested_data(mblog, "user", "screen_name") or "未知用户",
+        link=card.get("scheme", default_link),
+        # 提取 large_url
+        image_urls=[get_nested_data(pic, "large", "url") for pic in pics] if pics else [],
+        created_at=parse_created_at(mblog.get("created_at")),
+    )
+
+
+def image_variants(url):
+    """
+    微博图片 URL 的候选尺寸，从原 URL 开始依次变小。
+
+    例如 https://wx1.sinaimg.cn/large/abc.jpg 依次为 large、bmiddle、orj360，
+    无法识别的 URL 只返回它本身。
+    """
+    scheme, sep, rest = url.partition("://")
+    parts = rest.split("/")
+    if not sep or len(parts) < 3 or not parts[0].endswith("sinaimg.cn"):
+        return [url]
+    sizes = IMAGE_FALLBACK_SIZES
+    if parts[1] in sizes:
+        # 已经是较小的尺寸，只尝试更小的
+        sizes = sizes[sizes.index(parts[1]) + 1 :]
+    variants = [url]
+    for size in sizes:
+        variants.append(f"{scheme}://{'/'.join([parts[0], size, *parts[2:]])}")
+    return variants
+
+
+def is_throttled(response):
+    """getIndex 响应是否表示被微博限流：限流状态码，或被重定向到登录/验证码页面。"""
+    if response.status_code in THROTTLE_STATUS_CODES:
+        return True
+    if response.status_code != 200:
+        return False
+    url = response.url or ""
+    if "passport.weibo" in url or "captcha" in url:
+        return True
+    # 正常响应是 JSON，返回 HTML 说明是验证码或拦截页
+    return response.content[:64].lstrip().startswith(b"<")
+
+
+def parse_index_page(content, default_link, newest_seen=None):
+    """
+    解析一页 getIndex 响应。
+
+    参数：
+    - content: 响应的原始字节
+    - default_link: 卡片没有 scheme 时使用的链接
+    - newest_seen: 已处理过的最新博文ID（整数），遇到不比它新的非置顶博文即停止解析
+
+    返回值：
+    - (posts, reached_known, since_id)。posts 包含停止处的那条已知博文
+    """
+    data = loads(content).get("data") or {}
+    posts = []
+    reached_known = False
+    for card in data.get("cards") or ():
+        # 非博文卡片（推荐、分组标题等）直接跳过，不做任何解析
+        if card.get("card_type") != POST_CARD_TYPE or "mblog" not in card:
+            continue
+        post = parse_post(card, default_link)
+        posts.append(post)
+        post_id = parse_post_id(post.id)
+        # 置顶博文不按时间排序，不能作为停止条件
+        if (
+            newest_seen is not None
+            and post_id is not None
+            and post_id <= newest_seen
+            and not card["mblog"].get("isTop")
+        ):
+            reached_known = True
+            break
+    since_id = get_nested_data(data, "cardlistInfo", "since_id")
+    return posts, reached_known, since_id
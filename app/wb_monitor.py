@@ -1,122 +1,832 @@
-import requests
-import json
+import argparse
 import os
+import threading
 import time
+from collections import namedtuple
+from functools import partial
+
 import yaml
 
+from app.plog.handler import LarkLogHandler
 from app.plog.logger import setup_logger
-from app.utils import lark, lark_boot_webhook_msg
+from app.utils import circuit, lark, lark_boot_webhook_msg, metrics, transport
+from app.utils.circuit import CircuitOpenError
+from app.utils.concurrency import DeadlineExceeded, HostLimiter, run_concurrently
+from app.utils.dedup import open_sent_store
+from app.utils.delivery import DeliveryQueue
+from app.utils.digest import DEFAULT_MAX_CARD_BYTES, DigestBuffer, build_digest_cards
+from app.utils.fingerprint import FingerprintIndex
+from app.utils.hedge import HedgedRequester
+from app.utils.image_cache import ImageKeyCache
+from app.utils.image_process import ImageProcessor
+from app.utils.outbox import FAILED, UPLOADED, Outbox
+from app.utils.session_pool import SessionPool
+from app.utils.weibo import is_throttled, parse_index_page, parse_post_id
 
 
-log = setup_logger(name="monitor")
+# 修改后需要重启进程才会生效的配置段
+RESTART_REQUIRED_KEYS = (
+    "sent_ids_file",
+    "dedup",
+    "outbox",
+    "delivery",
+    "image_cache",
+    "http",
+    "log",
+    "shard",
+    "circuit_breaker",
+    "image_process",
+    "fingerprint",
+    "digest",
+    "weibo_sessions",
+)
 
-# 读取配置文件
-with open("config.yml", "r", encoding="utf-8") as f:
-    config = yaml.safe_load(f)
 
-USER_IDS = config.get("user_ids", [])
-LARK_WEBHOOK_URL = config.get("lark", {}).get("webhook_url", "")
-LARK_WEBHOOK_SECRET = config.get("lark", {}).get("webhook_secret", "")
-SENT_IDS_FILE = config.get("sent_ids_file", "sent_ids.json")
-APP_ID = config.get("lark", {}).get("app_id", "")
-APP_SECRET = config.get("lark", {}).get("app_secret", "")
+# 本轮结束时至少等待发送队列的秒数，即使已超过 fetch.deadline
+MIN_DELIVERY_WAIT = 5
 
-client = lark.LarkClient(APP_ID, APP_SECRET)
 
+# 推送目标：name 唯一标识目标，user_ids 为订阅的用户集合，None 表示订阅全部用户
+Target = namedtuple("Target", ["name", "bot", "user_ids"])
 
-def fetch_latest_posts(user_id):
-    """获取指定微博用户的最新博文。"""
-    container_id = f"107603{user_id}"
-    weibo_api_url = f"https://m.weibo.cn/api/container/getIndex?type=uid&value={user_id}&containerid={container_id}"
-    log.info(weibo_api_url)
 
-    response = requests.get(weibo_api_url)
-    if response.status_code == 200:
-        data = response.json()
-        cards = data.get("data", {}).get("cards", [])
+def load_config(path="config.yml"):
+    """读取配置文件。"""
+    with open(path, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f) or {}
 
-        posts = []
-        for card in cards:
-            username = (
-                card.get("mblog", {}).get("user", {}).get("screen_name", "未知用户")
-            )
-
-            if card.get("card_type") == 9:
-                mblog = card.get("mblog", {})
-                post_id = mblog.get("id")
-                text = mblog.get("text")
-                # 清理文本，移除HTML标签
-                # soup = BeautifulSoup(text, "html.parser")
-                # plain_text = soup.get_text()
-                plain_text = text
-                # 提取 large_url
-                image_urls = []
-                if mblog.get("pics") is not None:
-                    image_urls = [pic["large"]["url"] for pic in mblog.get("pics")]
-
-                posts.append(
-                    {
-                        "id": post_id,
-                        "text": plain_text,
-                        "username": username,
-                        "image_urls": image_urls,
-                        "link": card.get("scheme", weibo_api_url),
-                    }
+
+def _config_mtime(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class Monitor:
+    """
+    微博监控应用：持有配置、日志器、飞书客户端和发送队列。
+
+    导入模块不会读取配置或创建任何对象，构造 Monitor 时才加载 config_path。
+    reload_if_changed() 按修改时间检测配置文件变化，在进程内应用用户列表、
+    飞书凭据、并发和抓取参数，不丢失连接池、令牌桶等运行状态；
+    存储路径、http、log 等段的修改需要重启才会生效。
+    """
+
+    def __init__(self, config_path="config.yml"):
+        self.config_path = config_path
+        self._mtime = _config_mtime(config_path)
+        config = load_config(config_path)
+        self.config = config
+        self.log = self._setup_log(config)
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+
+        self.sent_ids_file = config.get("sent_ids_file", "sent_ids.json")
+        # 去重存储：sqlite（默认，增量写入）、compact（常驻内存的紧凑窗口）或 json（旧版整文件读写）
+        dedup = config.get("dedup", {})
+        self.dedup_backend = dedup.get("backend", "sqlite")
+        self.dedup_path = dedup.get("path", "sent_ids.db")
+        if self.dedup_backend in ("compact", "json") and config.get("shard", {}).get("enabled", False):
+            # 这两种后端把状态读入进程内存后整体写回，多个 worker 共享时会互相覆盖
+            raise Exception(
+                f"dedup.backend 为 {self.dedup_backend} 时不能开启 shard，多 worker 请使用 sqlite"
+            )
+        self.dedup_options = {}
+        if self.dedup_backend == "compact":
+            self.dedup_options = {
+                "window": dedup.get("window", 64),
+                "bloom_capacity": dedup.get("bloom_capacity", 1000000),
+                "bloom_error_rate": dedup.get("bloom_error_rate", 0.001),
+            }
+        self._sent_store = None
+        # 发件箱：逐条记录博文的处理进度，重启后从中断处继续
+        self.outbox_path = config.get("outbox", {}).get("path", "outbox.db")
+        self.outbox_max_attempts = config.get("outbox", {}).get("max_attempts", 5)
+
+        # 共享 HTTP 连接池：超时、连接池大小、请求头统一在 http 段配置
+        transport.configure(**config.get("http", {}))
+        # 按主机熔断：微博限流时暂停请求，退避后探测恢复
+        circuit.configure(**config.get("circuit_breaker", {}))
+        # 微博会话池：多个访客 / 登录会话轮换抓取 getIndex，每个会话单独熔断、限速
+        weibo_sessions = config.get("weibo_sessions", {})
+        self.session_pool = None
+        if weibo_sessions.get("enabled", False):
+            self.session_pool = SessionPool(
+                visitors=weibo_sessions.get("visitors", 2),
+                cookies=weibo_sessions.get("cookies", []),
+                strategy=weibo_sessions.get("strategy", "least_throttled"),
+                user_agents=weibo_sessions.get("user_agents", []),
+                max_failures=weibo_sessions.get("max_failures", 3),
+                max_age=weibo_sessions.get("max_age", 3600),
+                transport_options=config.get("http", {}),
+                breaker_options=config.get("circuit_breaker", {}),
+            )
+
+        # 图片 image_key 缓存：避免重试、转发时重复上传同一张图片
+        image_cache_config = config.get("image_cache", {})
+        self.image_cache = None
+        if image_cache_config.get("enabled", True):
+            self.image_cache = ImageKeyCache(
+                path=image_cache_config.get("path", "image_keys.db"),
+                ttl=image_cache_config.get("ttl", 30 * 24 * 3600),
+                max_entries=image_cache_config.get("max_entries", 10000),
+            )
+
+        # 近似重复内容索引：多个账号转发、重新发布的相同内容只完整推送一次
+        fingerprint = config.get("fingerprint", {})
+        self.fingerprint_index = None
+        self.fingerprint_mode = fingerprint.get("mode", "reference")
+        if fingerprint.get("enabled", False):
+            if self.fingerprint_mode not in ("skip", "reference"):
+                raise Exception(f"fingerprint.mode 只能是 skip 或 reference: {self.fingerprint_mode}")
+            self.fingerprint_index = FingerprintIndex(
+                path=fingerprint.get("path", "fingerprints.db"),
+                window=fingerprint.get("window", 24 * 3600),
+                max_distance=fingerprint.get("max_distance", 3),
+                min_text_length=fingerprint.get("min_text_length", 10),
+            )
+
+        # 上传前缩放 / 重新压缩图片，需要安装 Pillow
+        image_process = config.get("image_process", {})
+        self.image_processor = None
+        if image_process.get("enabled", False):
+            self.image_processor = ImageProcessor(
+                max_dimension=image_process.get("max_dimension", 2048),
+                quality=image_process.get("quality", 85),
+                workers=image_process.get("workers", 2),
+                min_bytes=image_process.get("min_bytes", 256 * 1024),
+            )
+            if not self.image_processor.available:
+                self.log.warning("未安装 Pillow，image_process 不生效")
+
+        # 摘要模式：一段时间内的多条博文合并成一张卡片发送
+        digest = config.get("digest", {})
+        self.digest = None
+        if digest.get("enabled", False):
+            self.digest = DigestBuffer(
+                window=digest.get("window", 300),
+                max_posts=digest.get("max_posts", 20),
+                scope=digest.get("scope", "user"),
+            )
+        self.digest_summary_length = digest.get("summary_length", 80)
+        self.digest_max_card_bytes = digest.get("max_card_bytes", DEFAULT_MAX_CARD_BYTES)
+
+        self.client = None
+        self.targets = {}
+        self.host_limiter = None
+        self.hedger = None
+        self._hedge_config = None
+        # 上一轮到时限仍未抓取的用户，下一轮优先抓取
+        self.carried_over = []
+        # 分片模式下的 ShardCoordinator，由 app.checker 设置
+        self.coordinator = None
+        self._delivery_queues = {}
+        self._apply(config)
+
+    def _setup_log(self, config):
+        log_config = config.get("log", {})
+        alert_config = log_config.get("alert", {})
+        log_handlers = []
+        if alert_config.get("enabled", False):
+            # 警告以上的日志按时间窗合并去重后推送到飞书
+            log_handlers.append(
+                LarkLogHandler(
+                    lark_boot_webhook_msg.LarkBot(
+                        alert_config.get("webhook_url") or config.get("lark", {}).get("webhook_url", ""),
+                        alert_config.get("webhook_secret") or config.get("lark", {}).get("webhook_secret", ""),
+                    ),
+                    window=alert_config.get("window", 60),
+                    max_alerts=alert_config.get("max_alerts", 20),
+                )
+            )
+        return setup_logger(
+            name="monitor",
+            level=log_config.get("level", "INFO"),
+            async_mode=log_config.get("async", True),
+            json_format=log_config.get("json", False),
+            extra_handlers=log_handlers,
+        )
+
+    def _apply(self, config):
+        """应用可以热更新的配置。"""
+        lark_config = config.get("lark", {})
+        concurrency = config.get("concurrency", {})
+
+        self._apply_targets(config)
+        # 监控的用户：user_ids 与各目标订阅的用户的并集，每个用户只抓取一次
+        user_ids = [str(user_id) for user_id in config.get("user_ids", [])]
+        for target in self.targets.values():
+            user_ids.extend(target.user_ids or ())
+        self.user_ids = list(dict.fromkeys(user_ids))
+        # 并发抓取配置：最大同时进行的请求数，以及单个主机的并发上限
+        self.max_workers = concurrency.get("max_workers", 8)
+        per_host = concurrency.get("per_host", 4)
+        if self.host_limiter is None or self.host_limiter.per_host != per_host:
+            self.host_limiter = HostLimiter(per_host)
+        # 新用户建档：首次抓取只记录现有博文，最多推送最新的 backfill 条
+        onboarding = config.get("onboarding", {})
+        self.onboarding_auto = onboarding.get("auto", True)
+        self.onboarding_backfill = onboarding.get("backfill", 0)
+        # 微博接口地址，测试时可指向本地替身服务
+        self.weibo_api_base = config.get("weibo", {}).get("api_base", "https://m.weibo.cn").rstrip("/")
+        fetch = config.get("fetch", {})
+        # 增量抓取：整页都是新博文时最多翻几页
+        self.max_pages = fetch.get("max_pages", 3)
+        # 每轮的时限（秒），到期后未开始抓取的用户顺延到下一轮，0 表示不限
+        self.cycle_deadline = fetch.get("deadline", 0)
+        # getIndex 对冲请求，配置变化时重建
+        hedge = fetch.get("hedge", {})
+        if hedge != self._hedge_config:
+            self._hedge_config = hedge
+            self.hedger = None
+            if hedge.get("enabled", False):
+                self.hedger = HedgedRequester(
+                    quantile=hedge.get("quantile", 0.95),
+                    min_delay=hedge.get("min_delay", 0.05),
+                    max_ratio=hedge.get("max_ratio", 0.05),
+                    workers=hedge.get("workers", 2 * self.max_workers),
                 )
+        # 指标：是否按用户打标签（用户很多时建议关闭）
+        metrics.registry.per_user = config.get("metrics", {}).get("per_user", False)
+
+        app_id = lark_config.get("app_id", "")
+        app_secret = lark_config.get("app_secret", "")
+        api_base = lark_config.get("api_base", lark.DEFAULT_API_BASE)
+        client = self.client
+        if client is None or (client.app_id, client.app_secret, client.api_base) != (
+            app_id,
+            app_secret,
+            api_base.rstrip("/"),
+        ):
+            if client is not None:
+                client.close()
+                if client.app_id != app_id and self.image_cache is not None:
+                    # 旧应用上传的 image_key 在新应用下不可用
+                    self.image_cache.clear()
+            self.client = lark.LarkClient(
+                app_id,
+                app_secret,
+                image_cache=self.image_cache,
+                # 多个进程共享的 tenant_access_token 缓存文件
+                token_cache_path=lark_config.get("token_cache", "lark_token.json"),
+                api_base=api_base,
+                image_processor=self.image_processor,
+            )
+        # 图片流式传输：单张图片大小上限，以及超过多少字节后落盘
+        image_transfer = config.get("image_transfer", {})
+        self.client.upload_workers = concurrency.get("upload_workers", 4)
+        self.client.max_image_bytes = image_transfer.get("max_bytes", 20 * 1024 * 1024)
+        self.client.spool_threshold = image_transfer.get("spool_threshold", 1024 * 1024)
+        # 超过字节预算的原图改用 bmiddle、orj360 等更小的尺寸，0 表示不限
+        self.client.image_budget = image_transfer.get("budget_bytes", 0)
+
+    def _apply_targets(self, config):
+        """按 targets 配置更新推送目标，未配置时使用 lark.webhook_url 推送全部用户。"""
+        lark_config = config.get("lark", {})
+        target_configs = config.get("targets") or [
+            {
+                "name": "default",
+                "webhook_url": lark_config.get("webhook_url", ""),
+                "webhook_secret": lark_config.get("webhook_secret", ""),
+            }
+        ]
+        targets = {}
+        for index, target_config in enumerate(target_configs):
+            name = str(target_config.get("name") or f"target{index}")
+            if name in targets:
+                raise Exception(f"推送目标名称重复: {name}")
+            webhook = (target_config.get("webhook_url", ""), target_config.get("webhook_secret", ""))
+            old = self.targets.get(name)
+            if old is not None and (old.bot.webhook_url, old.bot.webhook_secret) == webhook:
+                bot = old.bot
+            else:
+                bot = lark_boot_webhook_msg.LarkBot(*webhook)
+            user_ids = target_config.get("user_ids")
+            targets[name] = Target(
+                name, bot, frozenset(str(user_id) for user_id in user_ids) if user_ids else None
+            )
+        # 全部校验通过后才生效
+        for name, target in targets.items():
+            queue = self._delivery_queues.get(name)
+            if queue is not None and queue.bot is not target.bot:
+                # 发送队列保留令牌桶和待发送的卡片，只替换机器人
+                queue.bot = target.bot
+        self.targets = targets
+
+    def owns(self, user_id):
+        """分片模式下本 worker 是否仍持有该用户所在分片的租约，未开启分片时总是 True。"""
+        return self.coordinator is None or self.coordinator.owns(user_id)
+
+    def targets_for(self, user_id):
+        """订阅了该用户的推送目标。"""
+        return [
+            target
+            for target in self.targets.values()
+            if target.user_ids is None or user_id in target.user_ids
+        ]
+
+    def reload_if_changed(self):
+        """
+        配置文件修改时间变化时重新加载。
+
+        返回值：
+        - 是否应用了新配置。新配置读取或应用失败时保留旧配置并返回 False
+        """
+        mtime = _config_mtime(self.config_path)
+        if mtime is None or mtime == self._mtime:
+            return False
+        with self._reload_lock:
+            if mtime == self._mtime:
+                return False
+            self._mtime = mtime
+            try:
+                config = load_config(self.config_path)
+                old_users = set(self.user_ids)
+                self._apply(config)
+            except Exception as e:
+                self.log.error(f"重新加载配置 {self.config_path} 失败，继续使用旧配置: {e}")
+                return False
+            new_users = set(self.user_ids)
+            added, removed = new_users - old_users, old_users - new_users
+            self.log.info(
+                f"已重新加载配置：新增用户 {sorted(added)}，移除用户 {sorted(removed)}"
+            )
+            for key in RESTART_REQUIRED_KEYS:
+                if config.get(key) != self.config.get(key):
+                    self.log.warning(f"配置项 {key} 已修改，重启后生效")
+            self.config = config
+        return True
+
+    def start_watching(self, interval=5):
+        """启动后台线程，每 interval 秒检查一次配置文件。"""
+        if self._watcher is not None:
+            return
+
+        def watch():
+            while True:
+                time.sleep(interval)
+                self.reload_if_changed()
+
+        self._watcher = threading.Thread(target=watch, name="config-watcher", daemon=True)
+        self._watcher.start()
+
+    def get_delivery_queue(self, target_name):
+        """
+        获取推送目标的发送队列，令牌桶状态跨轮询周期保留。
+
+        飞书按机器人限流，每个目标有独立的队列和发送线程，各目标之间并发发送。
+        """
+        queue = self._delivery_queues.get(target_name)
+        if queue is None:
+            delivery = self.config.get("delivery", {})
+            # 飞书 Webhook 发送限速，默认匹配自定义机器人 5 次/秒、100 次/分钟
+            queue = self._delivery_queues[target_name] = DeliveryQueue(
+                self.targets[target_name].bot,
+                per_second=delivery.get("per_second", 5),
+                per_minute=delivery.get("per_minute", 100),
+                max_attempts=delivery.get("max_attempts", 3),
+                max_backoff=delivery.get("max_backoff", 60),
+                rate_limit_timeout=delivery.get("rate_limit_timeout", 300),
+                log=self.log,
+                name=f"lark-delivery-{target_name}",
+            )
+        return queue
+
+    def _open_sent_store(self):
+        """compact 存储常驻内存、跨轮询周期复用，其他存储每轮打开一次。"""
+        if self.dedup_backend != "compact":
+            return open_sent_store(self.dedup_backend, self.dedup_path, self.sent_ids_file)
+        if self._sent_store is None:
+            self._sent_store = open_sent_store(
+                self.dedup_backend, self.dedup_path, self.sent_ids_file, **self.dedup_options
+            )
+        return self._sent_store
+
+    def fetch_latest_posts(self, user_id, newest_seen_id=None):
+        """
+        获取指定微博用户的最新博文。
+
+        参数：
+        - user_id: 微博用户ID
+        - newest_seen_id: 该用户已处理过的最新博文ID。给定时遇到不比它新的博文即停止解析；
+          若整页都是新博文，则沿 since_id 继续翻页，最多 max_pages 页
+
+        返回值：
+        - Post 列表。增量模式下包含停止处的那条已知博文，供调度器估算发博间隔，去重时会被过滤
+        """
+        container_id = f"107603{user_id}"
+        weibo_api_url = f"{self.weibo_api_base}/api/container/getIndex?type=uid&value={user_id}&containerid={container_id}"
+        newest_seen = parse_post_id(newest_seen_id)
+
+        posts = []
+        since_id = None
+        for _ in range(self.max_pages):
+            page_url = weibo_api_url if since_id is None else f"{weibo_api_url}&since_id={since_id}"
+            self.log.debug(page_url)
+
+            session = None
+            if self.session_pool is not None:
+                session = self.session_pool.acquire()
+                session.prepare(f"{self.weibo_api_base}/")
+                breaker, http = session.breaker, session.transport
+            else:
+                breaker, http = circuit.get_breakers().get(page_url), transport.get_transport()
+            # 熔断中直接抛出 CircuitOpenError，不再发请求
+            breaker.before_request()
+            try:
+                with self.host_limiter.limit(page_url), metrics.timer(
+                    "weibo_fetch_seconds", help="getIndex latency", **metrics.user_labels(user_id)
+                ):
+                    get = http.get
+                    if self.hedger is not None and not breaker.interval:
+                        # 限速期间不对冲，避免加重限流
+                        response = self.hedger.call(get, page_url)
+                    else:
+                        response = get(page_url)
+            except Exception:
+                breaker.record_error()
+                raise
+            metrics.inc(
+                "weibo_fetch_total",
+                help="getIndex requests by HTTP status",
+                status=response.status_code,
+                **metrics.user_labels(user_id),
+            )
+            if is_throttled(response):
+                breaker.record_throttled()
+                if session is not None:
+                    self.session_pool.report_throttled(session)
+                raise Exception(f"微博限流，状态码 {response.status_code}")
+            if response.status_code != 200:
+                breaker.record_error()
+                self.log.warning(f"获取用户 {user_id} 的微博失败，状态码 {response.status_code}")
+                break
+
+            breaker.record_success()
+            if session is not None:
+                self.session_pool.report_success(session)
+            page_posts, reached_known, since_id = parse_index_page(
+                response.content, weibo_api_url, newest_seen
+            )
+            posts.extend(page_posts)
+
+            # 首次抓取（没有游标）只看第一页，避免把历史博文当作新博文
+            if reached_known or newest_seen is None or not since_id:
+                break
         return posts
-    else:
-        log.warning(f"获取用户 {user_id} 的微博失败，状态码 {response.status_code}")
-        return []
-
-
-def load_sent_ids():
-    """加载已发送的消息ID字典。"""
-    if os.path.exists(SENT_IDS_FILE):
-        with open(SENT_IDS_FILE, "r", encoding="utf-8") as f:
-            sent_ids = json.load(f)
-            # 将列表转换为集合
-            for user_id in sent_ids:
-                sent_ids[user_id] = set(sent_ids[user_id])
-    else:
-        sent_ids = {}
-    return sent_ids
-
-
-def save_sent_ids(sent_ids):
-    """保存已发送的消息ID字典。"""
-    # 将集合转换为列表以便JSON序列化
-    serializable_sent_ids = {user_id: list(ids) for user_id, ids in sent_ids.items()}
-    with open(SENT_IDS_FILE, "w", encoding="utf-8") as f:
-        json.dump(serializable_sent_ids, f, ensure_ascii=False, indent=4)
-
-
-def check():
-    lark_bot = lark_boot_webhook_msg.LarkBot(LARK_WEBHOOK_URL, LARK_WEBHOOK_SECRET)
-    sent_ids = load_sent_ids()
-    for user_id_i in USER_IDS:
-        user_id = str(user_id_i)
-        latest_posts = fetch_latest_posts(user_id)
-        user_sent_ids = sent_ids.get(user_id, set())
-        new_posts = [post for post in latest_posts if post["id"] not in user_sent_ids]
-        for post in new_posts:
-            log.info(post)
+
+    def deliver_post(self, user_id, post, sent_store, outbox):
+        """
+        上传博文图片并提交给订阅该用户的所有目标，每完成一步都记录到发件箱。
+
+        图片只上传一次，卡片只构建、序列化一次；全部目标送达后才记为已发送。
+        开启 fingerprint 时，与窗口内已推送博文重复的内容在上传图片前拦截：
+        已收到原博文的目标跳过或只收到一张指向原博文的引用卡片。
+        开启 digest 时，上传完图片的博文先进入摘要缓存，由 flush_digest 合并发送。
+        """
+        subscribed = {target.name for target in self.targets_for(user_id)}
+        delivered = outbox.delivered(user_id, post.id)
+        targets = [target for target in self.targets_for(user_id) if target.name not in delivered]
+        if not targets:
+            # 没有需要推送的目标，或已全部送达但未来得及更新状态
+            sent_store.add(user_id, post.id)
+            outbox.mark_sent(user_id, post.id)
+            return
+
+        duplicate_targets = []
+        if self.fingerprint_index is not None:
+            match = self.fingerprint_index.find(user_id, post)
+            if match is not None:
+                # 只有同样订阅了原博文用户的目标才收到过原内容
+                covered = {target.name for target in self.targets_for(match.user_id)}
+                duplicate_targets = [target for target in targets if target.name in covered]
+                targets = [target for target in targets if target.name not in covered]
+                self.log.info(f"用户 {user_id} 的博文 {post.id} 与 {match.user_id} 的 {match.post_id} 重复")
+                metrics.inc("posts_duplicate_total", help="Near-duplicate posts", mode=self.fingerprint_mode)
+            if targets:
+                self.fingerprint_index.add(user_id, post)
+
+        state, img_keys = outbox.get(user_id, post.id)
+        if targets and state != UPLOADED:
             img_keys = []
-            if post["image_urls"] is not None:
-                img_keys = client.upload_images_from_urls(image_urls=post["image_urls"])
-
-            log.info(user_id, post)
-            lark_bot.send_card_msg(
-                card=lark_boot_webhook_msg.build_card_message(
-                    post["username"],
-                    f"{post['text']}\n[快速链接]({post['link']})",
-                    img_keys,
-                )
+            if post.image_urls:
+                img_keys = self.client.upload_images_from_urls(image_urls=post.image_urls)
+            outbox.mark_uploaded(user_id, post.id, img_keys)
+
+        def on_sent(target):
+            self._on_delivered(user_id, post, target.name, sent_store, outbox, subscribed)
+
+        def on_failed(rsp):
+            self._on_send_failed(user_id, post, rsp, outbox)
+
+        for target in duplicate_targets:
+            if self.fingerprint_mode == "skip":
+                on_sent(target)
+                continue
+            reference = lark_boot_webhook_msg.build_card_message(
+                post.username,
+                f"与 {match.username} 的博文内容重复，已省略。\n[原博文]({match.link}) [本条]({post.link})",
+            )
+            self.get_delivery_queue(target.name).submit(
+                reference, on_sent=partial(on_sent, target), on_failed=on_failed
             )
-            time.sleep(1)
-            user_sent_ids.add(post["id"])
-        sent_ids[user_id] = user_sent_ids
-    save_sent_ids(sent_ids)
+        if not targets:
+            return
+
+        if self.digest is not None:
+            # 先缓存，到期后在 flush_digest 中合并发送
+            for target in targets:
+                self.digest.add(target.name, user_id, post, img_keys)
+            return
+
+        card = lark_boot_webhook_msg.dump_card(
+            lark_boot_webhook_msg.build_card_message(
+                post.username,
+                f"{post.text}\n[快速链接]({post.link})",
+                img_keys,
+            )
+        )
+        for target in targets:
+            self.log.debug(f"发送用户 {user_id} 的博文 {post.id} 到 {target.name}")
+            # 交给目标的发送队列限速发送，发送成功后才记录
+            self.get_delivery_queue(target.name).submit(
+                card, on_sent=partial(on_sent, target), on_failed=on_failed
+            )
+
+    def _on_delivered(self, user_id, post, target_name, sent_store, outbox, subscribed=None):
+        """博文送达一个目标，所有订阅的目标都送达后记为已发送。"""
+        if subscribed is None:
+            subscribed = {target.name for target in self.targets_for(user_id)}
+        if not outbox.mark_delivered(user_id, post.id, target_name) >= subscribed:
+            return
+        sent_store.add(user_id, post.id)
+        outbox.mark_sent(user_id, post.id)
+        metrics.inc("posts_delivered_total", **metrics.user_labels(user_id))
+        if post.created_at:
+            # 从发博到推送完成的延迟
+            metrics.observe(
+                "post_delivery_lag_seconds",
+                time.time() - post.created_at,
+                help="Post created to delivered",
+                **metrics.user_labels(user_id),
+            )
+
+    def _on_send_failed(self, user_id, post, rsp, outbox):
+        if lark_boot_webhook_msg.is_rate_limited(rsp):
+            # 持续限流不计入失败次数，留在发件箱中下一轮重新发送
+            metrics.inc("posts_deferred_total", help="Posts left for the next cycle", reason="rate_limited")
+            return
+        outbox.mark_failed(user_id, post.id)
+        metrics.inc("posts_failed_total", stage="send", code=rsp.get("code") if rsp else None)
+
+    def flush_digest(self, sent_store, outbox, force=False):
+        """
+        把到期的摘要合并成卡片提交给目标的发送队列，未到期的留到下一轮。
+
+        缓存中的博文在发件箱中保持已上传状态，进程重启后会重新恢复进缓存。
+        """
+        if self.digest is None:
+            return
+        for target_name, entries in self.digest.pop_due(force=force):
+            if target_name not in self.targets:
+                # 目标已从配置中移除
+                continue
+            # 分片已交给其他 worker 的用户由新的负责人从发件箱恢复
+            entries = [entry for entry in entries if self.owns(entry.user_id)]
+            if not entries:
+                continue
+            cards = build_digest_cards(
+                entries, self.digest_summary_length, self.digest_max_card_bytes
+            )
+            self.log.info(f"发送 {len(entries)} 条博文的摘要到 {target_name}，共 {len(cards)} 张卡片")
+            metrics.inc("digest_cards_total", len(cards), help="Digest cards submitted")
+            for card, batch in cards:
+
+                def on_sent(batch=batch, target_name=target_name):
+                    for entry in batch:
+                        self._on_delivered(entry.user_id, entry.post, target_name, sent_store, outbox)
+
+                def on_failed(rsp, batch=batch):
+                    for entry in batch:
+                        self._on_send_failed(entry.user_id, entry.post, rsp, outbox)
+
+                self.get_delivery_queue(target_name).submit(card, on_sent=on_sent, on_failed=on_failed)
+
+    def _seed(self, user_id, posts, sent_store, process, outbox, backfill):
+        """
+        为新用户建档：把当前抓到的博文记为已发送，不下载图片也不发送卡片。
+
+        最新的 backfill 条博文照常经发件箱和限速队列推送。
+        """
+        posts = sorted(posts, key=lambda post: parse_post_id(post.id) or 0)
+        backfill_posts = posts[len(posts) - backfill :] if backfill > 0 else []
+        seeded = posts[: len(posts) - len(backfill_posts)]
+        for post_id in sent_store.filter_new(user_id, [post.id for post in seeded]):
+            sent_store.add(user_id, post_id)
+        # 已知的博文也推进游标；第一页为空时记录游标 0，标记该用户已建档
+        for post in seeded:
+            sent_store.advance_cursor(user_id, post.id)
+        if not posts:
+            sent_store.advance_cursor(user_id, "0")
+        metrics.inc("posts_seeded_total", len(seeded), help="Posts recorded as seen by onboarding")
+        new_ids = set(sent_store.filter_new(user_id, [post.id for post in backfill_posts]))
+        backfill_posts = [
+            post
+            for post in backfill_posts
+            if post.id in new_ids and outbox.get(user_id, post.id)[0] != FAILED
+        ]
+        self.log.info(f"用户 {user_id} 建档：记录 {len(seeded)} 条，推送 {len(backfill_posts)} 条")
+        for post in backfill_posts:
+            outbox.add_fetched(user_id, post)
+        for post in backfill_posts:
+            process(user_id, post)
+
+    def onboard(self, user_ids=None, backfill=None):
+        """
+        批量建档：并发抓取用户当前的第一页博文并记为已发送。
+
+        参数：
+        - user_ids: 要建档的用户，默认配置中的全部用户
+        - backfill: 每个用户同时推送最新的几条博文，默认为 onboarding.backfill
+        """
+        return self.check(user_ids, onboard=True, backfill=backfill)
+
+    def check(self, user_ids=None, onboard=False, backfill=None):
+        """
+        抓取并推送指定用户（默认配置中的全部 user_ids）的新博文。
+
+        上一轮或上次运行中未完成的博文会先从发件箱恢复。没有任何去重记录的新用户
+        （onboarding.auto 开启时）或 onboard=True 时的全部用户只建档，不推送历史博文。
+        设置了 fetch.deadline 时，到期后不再开始新的抓取，未抓取的用户记入 carried_over，
+        下一轮排在最前。
+
+        返回值：
+        - 字典，用户ID -> 本次抓取到的博文列表，抓取失败的用户为 None，顺延的用户不在其中
+        """
+        sent_store = self._open_sent_store()
+        outbox = Outbox(self.outbox_path, max_attempts=self.outbox_max_attempts)
+        if user_ids is None:
+            user_ids = self.user_ids
+        user_ids = [str(user_id) for user_id in user_ids]
+        # 上一轮顺延的用户排在最前
+        carried_over = set(self.carried_over) & set(user_ids)
+        user_ids = [u for u in self.carried_over if u in carried_over] + [
+            u for u in user_ids if u not in carried_over
+        ]
+        self.carried_over = []
+        results = {}
+        cycle_start = time.perf_counter()
+        deadline = time.monotonic() + self.cycle_deadline if self.cycle_deadline else None
+        # 本轮已处理的 (user_id, post_id)，避免恢复的博文被再次抓到时重复发送
+        handled = set()
+        if backfill is None:
+            backfill = self.onboarding_backfill
+        # 需要建档的用户：没有任何去重记录（已发送的博文或游标）
+        new_users = set()
+
+        def process(user_id, post):
+            handled.add((user_id, post.id))
+            if not self.owns(user_id):
+                # 分片已交给其他 worker，留在发件箱中由新的负责人处理
+                self.log.info(f"已不再负责用户 {user_id}，跳过博文 {post.id}")
+                return
+            try:
+                self.deliver_post(user_id, post, sent_store, outbox)
+            except CircuitOpenError as e:
+                # 图片主机熔断中，不计入失败次数，下轮从发件箱恢复
+                self.log.info(f"暂缓处理用户 {user_id} 的博文 {post.id}: {e}")
+            except Exception as e:
+                # 单条失败不影响其他博文，留在发件箱中下轮重试
+                self.log.warning(f"处理用户 {user_id} 的博文 {post.id} 失败: {e}")
+                outbox.mark_failed(user_id, post.id)
+                metrics.inc("posts_failed_total", stage="upload", code=type(e).__name__)
+
+        try:
+            for user_id, post in outbox.pending(user_ids):
+                if deadline is not None and time.monotonic() >= deadline:
+                    # 剩余的留在发件箱中，下一轮继续
+                    break
+                if sent_store.contains(user_id, post.id):
+                    # 已发送但未来得及更新发件箱
+                    outbox.mark_sent(user_id, post.id)
+                    continue
+                self.log.info(f"恢复未完成的博文 {user_id} {post.id}")
+                process(user_id, post)
+
+            def fetch(user_id):
+                if onboard or (self.onboarding_auto and not sent_store.has_user(user_id)):
+                    new_users.add(user_id)
+                    return self.fetch_latest_posts(user_id)
+                return self.fetch_latest_posts(user_id, sent_store.get_cursor(user_id))
+
+            # 并发抓取所有用户，按完成顺序进入去重/发送流程
+            skipped = 0
+            for user_id, latest_posts, err in run_concurrently(
+                fetch, user_ids, self.max_workers, deadline
+            ):
+                if isinstance(err, DeadlineExceeded):
+                    self.carried_over.append(user_id)
+                    continue
+                results[user_id] = latest_posts
+                if isinstance(err, CircuitOpenError):
+                    # 熔断期间的用户直接跳过，汇总记录一次
+                    skipped += 1
+                    metrics.inc("weibo_fetch_skipped_total", help="Fetches skipped by open circuit")
+                    continue
+                if err is not None:
+                    self.log.warning(f"获取用户 {user_id} 的微博异常: {err}")
+                    metrics.inc("weibo_fetch_errors_total", error=type(err).__name__)
+                    continue
+                if user_id in new_users:
+                    self._seed(user_id, latest_posts, sent_store, process, outbox, backfill)
+                    continue
+                new_ids = set(sent_store.filter_new(user_id, [post.id for post in latest_posts]))
+                new_posts = [
+                    post
+                    for post in latest_posts
+                    if post.id in new_ids
+                    and (user_id, post.id) not in handled
+                    and outbox.get(user_id, post.id)[0] != FAILED
+                ]
+                # 已处理过的博文推进游标，下次抓取到此即停
+                for post in latest_posts:
+                    if post.id not in new_ids:
+                        sent_store.advance_cursor(user_id, post.id)
+                # 从旧到新发送：中途失败时游标不会越过未发送的博文
+                new_posts.sort(key=lambda post: parse_post_id(post.id) or 0)
+                metrics.inc("posts_new_total", len(new_posts), **metrics.user_labels(user_id))
+                for post in new_posts:
+                    outbox.add_fetched(user_id, post)
+                for post in new_posts:
+                    self.log.debug(post)
+                    process(user_id, post)
+            if skipped:
+                self.log.warning(f"微博接口熔断中，本轮跳过 {skipped} 个用户")
+            if self.carried_over:
+                self.log.warning(f"本轮超过时限，{len(self.carried_over)} 个用户顺延到下一轮")
+                metrics.inc(
+                    "check_carried_over_total",
+                    len(self.carried_over),
+                    help="Users carried over by the cycle deadline",
+                )
+            self.flush_digest(sent_store, outbox)
+        finally:
+            # 等待本轮提交的卡片发送完毕再关闭存储。最多等到本轮时限（至少 MIN_DELIVERY_WAIT 秒）
+            # 或 delivery.join_timeout 秒，未发出的卡片留在发件箱中，下一轮重新提交
+            wait = self.config.get("delivery", {}).get("join_timeout", 60)
+            if deadline is not None:
+                wait = min(wait, max(MIN_DELIVERY_WAIT, deadline - time.monotonic()))
+            join_deadline = time.monotonic() + wait
+            for name, delivery_queue in list(self._delivery_queues.items()):
+                if not delivery_queue.join(max(0, join_deadline - time.monotonic())):
+                    self.log.warning(f"{name} 的卡片未能在本轮发完，剩余的下一轮继续发送")
+            outbox.close()
+            if sent_store is self._sent_store:
+                sent_store.flush()
+            else:
+                sent_store.close()
+            metrics.observe("check_cycle_seconds", time.perf_counter() - cycle_start, help="check() duration")
+        return results
+
+
+
+_default_monitor = None
+
+
+def get_monitor():
+    """获取按当前目录 config.yml 创建的默认 Monitor，首次调用时才加载配置。"""
+    global _default_monitor
+    if _default_monitor is None:
+        _default_monitor = Monitor()
+    return _default_monitor
+
+
+def fetch_latest_posts(user_id, newest_seen_id=None):
+    return get_monitor().fetch_latest_posts(user_id, newest_seen_id)
+
+
+def check(user_ids=None):
+    return get_monitor().check(user_ids)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.wb_monitor")
+    subparsers = parser.add_subparsers(dest="command")
+    check_parser = subparsers.add_parser("check", help="抓取并推送一轮新博文（默认）")
+    check_parser.add_argument("user_ids", nargs="*", help="只处理这些用户，默认全部")
+    onboard_parser = subparsers.add_parser("onboard", help="为用户建档：记录现有博文，不推送")
+    onboard_parser.add_argument("user_ids", nargs="*", help="要建档的用户，默认全部")
+    onboard_parser.add_argument("--backfill", type=int, default=None, help="每个用户推送最新的几条博文")
+    args = parser.parse_args(argv)
+
+    monitor = get_monitor()
+    if args.command == "onboard":
+        monitor.onboard(args.user_ids or None, backfill=args.backfill)
+    else:
+        monitor.check(getattr(args, "user_ids", None) or None)
 
 
 if __name__ == "__main__":
-    check()
+    main()
@@ -1,3 +1,3 @@
 cp config_demo.yml config.yml
-rm sent_ids.json
+rm -f sent_ids.json sent_ids.db
 python3 wb_monitor.py
\ No newline at end of file
@@ -0,0 +1,185 @@
+"""
+check() 压测脚本。
+
+在本地启动替身服务（见 tests/bench_servers.py），每个场景在独立子进程中
+生成临时 config.yml 并连续执行若干轮 check()，统计吞吐、各轮耗时的 p50/p99
+以及峰值内存（RSS）。
+
+用法：
+    python tests/bench.py --users 10,100,1000,10000 --cycles 5
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from tests.bench_servers import FakeBackend, start_fake_servers  # noqa: E402
+
+ROUTES = ("weibo", "cdn", "auth", "upload", "webhook")
+
+
+def percentile(values, q):
+    """最近秩百分位数。"""
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, int(round(q / 100 * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def write_config(workdir, base_url, users, args, backend):
+    config = {
+        "user_ids": list(range(1, users + 1)),
+        "lark": {
+            "webhook_url": f"{base_url}/hook",
+            "webhook_secret": "",
+            "app_id": "bench" if args.images_per_post else "",
+            "app_secret": "bench",
+            "api_base": f"{base_url}/open-apis",
+            "token_cache": os.path.join(workdir, "lark_token.json"),
+        },
+        "weibo": {"api_base": base_url},
+        "sent_ids_file": os.path.join(workdir, "sent_ids.json"),
+        "dedup": {"backend": "sqlite", "path": os.path.join(workdir, "sent_ids.db")},
+        "outbox": {"path": os.path.join(workdir, "outbox.db")},
+        "image_cache": {"path": os.path.join(workdir, "image_keys.db")},
+        "concurrency": {"max_workers": args.max_workers, "per_host": args.per_host},
+        # 替身 Webhook 不限流，放开发送速率以测量管线本身
+        "delivery": {"per_second": 100000, "per_minute": 6000000},
+        "http": {"pool_maxsize": args.max_workers, "host_pools": {}},
+    }
+    if args.cold:
+        # 冷启动场景测量全量推送，关闭新用户建档
+        config["onboarding"] = {"auto": False}
+    if args.targets > 1:
+        # 多个推送目标都订阅全部用户，测量一次抓取、多处发送
+        config["targets"] = [
+            {"name": f"t{i}", "webhook_url": f"{base_url}/hook/{i}"} for i in range(args.targets)
+        ]
+    path = os.path.join(workdir, "config.yml")
+    with open(path, "w", encoding="utf-8") as f:
+        # JSON 是 YAML 的子集
+        json.dump(config, f, ensure_ascii=False)
+
+    if not args.cold:
+        # 预置已发送记录（首次打开时自动迁移），第一轮即为稳态而不是全量推送
+        sent_ids = {
+            str(user_id): [str(post_id) for post_id in backend.initial_post_ids(user_id)]
+            for user_id in range(1, users + 1)
+        }
+        with open(config["sent_ids_file"], "w", encoding="utf-8") as f:
+            json.dump(sent_ids, f)
+    return path
+
+
+def run_child(cycles, result_path):
+    """子进程：在当前目录的 config.yml 下执行 cycles 轮 check()。"""
+    sys.path.insert(0, ROOT)
+    import logging
+
+    from app.wb_monitor import Monitor
+
+    monitor = Monitor()
+    # 压测时只保留警告以上的日志，避免 I/O 干扰计时
+    logging.getLogger("monitor").setLevel(logging.WARNING)
+
+    cycle_times = []
+    posts = 0
+    for _ in range(cycles):
+        start = time.perf_counter()
+        results = monitor.check()
+        cycle_times.append(time.perf_counter() - start)
+        posts += sum(len(p or []) for p in results.values())
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with open(result_path, "w", encoding="utf-8") as f:
+        json.dump({"cycle_times": cycle_times, "posts_parsed": posts, "peak_rss_kb": rss_kb}, f)
+
+
+def run_scenario(users, args):
+    backend = FakeBackend(
+        posts_per_page=args.posts_per_page,
+        images_per_post=args.images_per_post,
+        image_size=args.image_size,
+        new_post_prob=args.new_post_prob,
+        latency={route: getattr(args, f"latency_{route}") for route in ROUTES},
+        error_rate={route: getattr(args, f"error_{route}") for route in ROUTES},
+    )
+    server, base_url = start_fake_servers(backend)
+    try:
+        with tempfile.TemporaryDirectory(prefix="wb_bench_") as workdir:
+            write_config(workdir, base_url, users, args, backend)
+            result_path = os.path.join(workdir, "result.json")
+            code = (
+                "import sys; sys.path.insert(0, %r);"
+                "from tests.bench import run_child; run_child(%d, %r)"
+                % (ROOT, args.cycles, result_path)
+            )
+            subprocess.run(
+                [sys.executable, "-c", code],
+                cwd=workdir,
+                check=True,
+                stdout=subprocess.DEVNULL,
+                stderr=None if args.verbose else subprocess.DEVNULL,
+            )
+            with open(result_path, "r", encoding="utf-8") as f:
+                result = json.load(f)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    cycle_times = result["cycle_times"]
+    steady = cycle_times[1:] or cycle_times
+    return {
+        "users": users,
+        "first_cycle_s": cycle_times[0],
+        "p50_s": percentile(steady, 50),
+        "p99_s": percentile(steady, 99),
+        "users_per_s": users / percentile(steady, 50) if percentile(steady, 50) else 0.0,
+        "peak_rss_mb": result["peak_rss_kb"] / 1024,
+        "requests": dict(backend.counts),
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="check() 压测")
+    parser.add_argument("--users", default="10,100,1000,10000", help="逗号分隔的用户数场景")
+    parser.add_argument("--cycles", type=int, default=5, help="每个场景执行几轮 check()")
+    parser.add_argument("--max-workers", type=int, default=32)
+    parser.add_argument("--per-host", type=int, default=32)
+    parser.add_argument("--posts-per-page", type=int, default=5)
+    parser.add_argument("--images-per-post", type=int, default=2)
+    parser.add_argument("--image-size", type=int, default=64 * 1024)
+    parser.add_argument("--new-post-prob", type=float, default=0.2)
+    parser.add_argument("--targets", type=int, default=1, help="推送目标数，每个目标订阅全部用户")
+    for route, latency in zip(ROUTES, (0.05, 0.02, 0.05, 0.05, 0.03)):
+        parser.add_argument(f"--latency-{route}", type=float, default=latency)
+        parser.add_argument(f"--error-{route}", type=float, default=0.0)
+    parser.add_argument("--cold", action="store_true", help="不预置已发送记录，第一轮推送所有博文")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    parser.add_argument("--verbose", action="store_true", help="显示子进程的错误输出")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = []
+    for users in (int(n) for n in args.users.split(",")):
+        result = run_scenario(users, args)
+        results.append(result)
+        if not args.json:
+            print(
+                f"users={result['users']:>6}  first={result['first_cycle_s']:8.2f}s"
+                f"  p50={result['p50_s']:7.2f}s  p99={result['p99_s']:7.2f}s"
+                f"  throughput={result['users_per_s']:8.1f} users/s"
+                f"  peak_rss={result['peak_rss_mb']:6.1f}MB"
+                f"  requests={result['requests']}"
+            )
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
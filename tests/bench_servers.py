@@ -0,0 +1,198 @@
+"""
+本地替身服务：模拟 m.weibo.cn getIndex、sinaimg 图片 CDN、飞书鉴权/图片上传接口和 Webhook。
+
+每类接口都可以单独配置延迟、错误率和数据大小，供 tests/bench.py 压测 check() 使用。
+"""
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+CST = timezone(timedelta(hours=8))
+
+
+class FakeBackend:
+    """
+    替身服务的状态与参数。
+
+    参数：
+    - posts_per_page: getIndex 每页博文数
+    - images_per_post: 每条博文的图片数
+    - image_size: 图片字节数
+    - new_post_prob: 每次请求用户第一页时产生一条新博文的概率
+    - latency: 各接口的平均延迟（秒），键为 weibo / cdn / auth / upload / webhook
+    - error_rate: 各接口返回错误的概率，键同上
+    """
+
+    def __init__(
+        self,
+        posts_per_page=5,
+        images_per_post=2,
+        image_size=64 * 1024,
+        new_post_prob=0.2,
+        latency=None,
+        error_rate=None,
+    ):
+        self.posts_per_page = posts_per_page
+        self.images_per_post = images_per_post
+        self.image_size = image_size
+        self.new_post_prob = new_post_prob
+        self.latency = latency or {}
+        self.error_rate = error_rate or {}
+        self.base_url = None
+        self._lock = threading.Lock()
+        self._latest = {}
+        self.counts = {}
+
+    def delay(self, route):
+        latency = self.latency.get(route, 0)
+        if latency:
+            time.sleep(latency * random.uniform(0.5, 1.5))
+
+    def failed(self, route):
+        with self._lock:
+            self.counts[route] = self.counts.get(route, 0) + 1
+        return random.random() < self.error_rate.get(route, 0)
+
+    def _post(self, user_id, seq):
+        post_id = user_id * 100000 + seq
+        created_at = datetime(2024, 1, 1, tzinfo=CST) + timedelta(hours=seq)
+        pics = [
+            {"large": {"url": f"{self.base_url}/large/{post_id}_{i}.jpg"}}
+            for i in range(self.images_per_post)
+        ]
+        return {
+            "card_type": 9,
+            "scheme": f"https://m.weibo.cn/status/{post_id}",
+            "mblog": {
+                "id": str(post_id),
+                "text": f"用户 {user_id} 的第 {seq} 条微博",
+                "created_at": created_at.strftime("%a %b %d %H:%M:%S %z %Y"),
+                "user": {"screen_name": f"user{user_id}"},
+                "pics": pics or None,
+            },
+        }
+
+    def initial_post_ids(self, user_id):
+        """用户初始的全部博文ID，用于预置已发送记录。"""
+        return [user_id * 100000 + seq for seq in range(1, self.posts_per_page * 3 + 1)]
+
+    def feed_page(self, user_id, since_id=None):
+        with self._lock:
+            latest = self._latest.setdefault(user_id, self.posts_per_page * 3)
+            if since_id is None and random.random() < self.new_post_prob:
+                latest = self._latest[user_id] = latest + 1
+        start = latest if since_id is None else int(since_id)
+        seqs = [seq for seq in range(start, start - self.posts_per_page, -1) if seq > 0]
+        next_since = seqs[-1] - 1 if seqs and seqs[-1] > 1 else None
+        return {
+            "ok": 1,
+            "data": {
+                "cardlistInfo": {"since_id": next_since},
+                "cards": [self._post(user_id, seq) for seq in seqs],
+            },
+        }
+
+    def image(self, path):
+        seed = path.encode("utf-8")
+        body = (seed * (self.image_size // len(seed) + 1))[: self.image_size]
+        return b"\xff\xd8" + body[2:]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    backend = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body, content_type="application/json"):
+        if not isinstance(body, bytes):
+            body = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _drain(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        while length > 0:
+            chunk = self.rfile.read(min(length, 65536))
+            if not chunk:
+                break
+            length -= len(chunk)
+
+    def do_GET(self):
+        backend = self.backend
+        url = urlsplit(self.path)
+        if url.path == "/api/container/getIndex":
+            backend.delay("weibo")
+            if backend.failed("weibo"):
+                self._reply(418, b"<html>captcha</html>", "text/html")
+                return
+            query = parse_qs(url.query)
+            since_id = query.get("since_id", [None])[0]
+            self._reply(200, backend.feed_page(int(query["value"][0]), since_id))
+        elif url.path.startswith("/large/"):
+            backend.delay("cdn")
+            if backend.failed("cdn"):
+                self._reply(500, b"error", "text/plain")
+                return
+            self._reply(200, backend.image(url.path), "image/jpeg")
+        else:
+            self._reply(404, {"code": 404})
+
+    def do_POST(self):
+        backend = self.backend
+        self._drain()
+        path = urlsplit(self.path).path
+        if path.endswith("/auth/v3/tenant_access_token/internal/"):
+            backend.delay("auth")
+            if backend.failed("auth"):
+                self._reply(200, {"code": 10003, "msg": "invalid param"})
+                return
+            self._reply(200, {"code": 0, "tenant_access_token": "t-bench", "expire": 7200})
+        elif path.endswith("/im/v1/images"):
+            backend.delay("upload")
+            if backend.failed("upload"):
+                self._reply(200, {"code": 234001, "msg": "invalid request"})
+                return
+            image_key = f"img_bench_{random.getrandbits(64):016x}"
+            self._reply(200, {"code": 0, "data": {"image_key": image_key}})
+        elif path == "/hook" or path.startswith("/hook/"):
+            backend.delay("webhook")
+            if backend.failed("webhook"):
+                self._reply(200, {"code": 9499, "msg": "too many request"})
+                return
+            self._reply(200, {"code": 0, "msg": "success", "data": {}})
+        else:
+            self._reply(404, {"code": 404})
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def start_fake_servers(backend, host="127.0.0.1", port=0):
+    """在后台线程启动替身服务，返回 (server, base_url)。"""
+    handler = type("Handler", (_Handler,), {"backend": backend})
+    server = _Server((host, port), handler)
+    backend.base_url = f"http://{host}:{server.server_port}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, backend.base_url
+
+
+if __name__ == "__main__":
+    backend = FakeBackend()
+    server, base_url = start_fake_servers(backend, port=8765)
+    print(f"fake servers on {base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
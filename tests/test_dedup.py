@@ -0,0 +1,162 @@
+"""
+CompactSentStore / BloomFilter 单元测试。
+
+用法：
+    python -m pytest -q tests/test_dedup.py
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.dedup import (  # noqa: E402
+    BloomFilter,
+    CompactSentStore,
+    SqliteSentStore,
+    open_sent_store,
+)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "sent_ids.db")
+
+
+def test_bloom_filter_membership():
+    bloom = BloomFilter(1000, 0.001)
+    keys = [f"u:{i}" for i in range(500)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+    assert bloom.count == 500
+    false_positives = sum(f"v:{i}" in bloom for i in range(5000))
+    assert false_positives < 50
+
+
+def test_bloom_filter_restores_from_bits():
+    bloom = BloomFilter(100, 0.01)
+    bloom.add("u:1")
+    restored = BloomFilter(100, 0.01, bytes(bloom.bits), bloom.count)
+    assert "u:1" in restored
+    assert restored.count == 1
+
+
+def test_window_evicts_oldest_when_full(db_path):
+    store = CompactSentStore(db_path, window=3, bloom_capacity=0)
+    for post_id in ("10", "20", "30", "40"):
+        store.add("u", post_id)
+    assert list(store._windows["u"]) == [20, 30, 40]
+    # 比窗口内最旧ID还旧的博文不再进入窗口
+    store.add("u", "5")
+    assert list(store._windows["u"]) == [20, 30, 40]
+    # 窗口范围内没有记录的ID仍是新博文
+    assert store.filter_new("u", ["25", "30", "50"]) == ["25", "50"]
+    store.close()
+
+
+def test_older_than_window_without_bloom_is_sent(db_path):
+    store = CompactSentStore(db_path, window=2, bloom_capacity=0)
+    store.add("u", "10")
+    # 窗口未满时更旧的ID不能断定已发送
+    assert not store.contains("u", "5")
+    store.add("u", "20")
+    store.add("u", "30")
+    assert store.contains("u", "10")
+    assert store.contains("u", "5")
+    assert not store.contains("u", "25")
+    store.close()
+
+
+def test_older_than_window_with_bloom(db_path):
+    store = CompactSentStore(db_path, window=2, bloom_capacity=1000)
+    for post_id in ("10", "20", "30"):
+        store.add("u", post_id)
+    assert list(store._windows["u"]) == [20, 30]
+    assert store.contains("u", "10")
+    assert not store.contains("u", "5")
+    assert not store.contains("other", "10")
+    store.close()
+
+
+def test_bloom_generations_rotate(db_path):
+    store = CompactSentStore(db_path, window=1, bloom_capacity=2)
+    for post_id in ("1", "2", "3", "4"):
+        store.add("u", post_id)
+    assert len(store._blooms) == 2
+    assert all(store.contains("u", post_id) for post_id in ("1", "2", "3", "4"))
+    # 第三代开始时丢弃最旧的一代（1、2 所在的一代）
+    store.add("u", "5")
+    assert len(store._blooms) == 2
+    assert [bloom.count for bloom in store._blooms] == [2, 1]
+    assert not store.contains("u", "1")
+    assert not store.contains("u", "2")
+    assert all(store.contains("u", post_id) for post_id in ("3", "4", "5"))
+    store.close()
+
+
+def test_non_numeric_ids_use_bloom(db_path):
+    store = CompactSentStore(db_path, window=4, bloom_capacity=1000)
+    store.add("u", "abc")
+    assert store.contains("u", "abc")
+    assert not store.contains("u", "abd")
+    store.close()
+
+
+def test_flush_and_reload_round_trip(db_path):
+    store = CompactSentStore(db_path, window=2, bloom_capacity=1000)
+    for post_id in ("10", "20", "30"):
+        store.add("u", post_id)
+    store.advance_cursor("empty", "0")
+    store.close()
+
+    store = CompactSentStore(db_path, window=2, bloom_capacity=1000)
+    assert list(store._windows["u"]) == [20, 30]
+    assert store.get_cursor("u") == "30"
+    # 移出窗口的ID由持久化的布隆过滤器记住
+    assert store.contains("u", "10")
+    assert not store.contains("u", "5")
+    assert store.has_user("empty")
+    assert not store.has_user("unknown")
+    store.close()
+
+
+def test_reload_with_changed_bloom_size_starts_fresh(db_path):
+    store = CompactSentStore(db_path, window=1, bloom_capacity=1000)
+    store.add("u", "10")
+    store.add("u", "20")
+    store.close()
+
+    store = CompactSentStore(db_path, window=1, bloom_capacity=5000)
+    assert len(store._blooms) == 1
+    assert store._blooms[0].count == 0
+    assert not store.contains("u", "10")
+    store.close()
+
+
+def test_migrate_from_sqlite(db_path, tmp_path):
+    sqlite_store = SqliteSentStore(db_path)
+    for post_id in ("10", "20", "30"):
+        sqlite_store.add("u", post_id)
+    sqlite_store.advance_cursor("u", "40")
+    sqlite_store.advance_cursor("empty", "0")
+    sqlite_store.close()
+
+    json_path = str(tmp_path / "sent_ids.json")
+    store = open_sent_store("compact", db_path, json_path, window=2, bloom_capacity=1000)
+    assert store.get_cursor("u") == "40"
+    assert store.contains("u", "10")
+    assert store.contains("u", "30")
+    assert not store.contains("u", "35")
+    assert store.has_user("empty")
+    store.add("u", "50")
+    store.close()
+
+    # 已有窗口时不再重复导入，之后的写入保留
+    store = open_sent_store("compact", db_path, json_path, window=2, bloom_capacity=1000)
+    assert store.migrate_from_sqlite() == 0
+    assert list(store._windows["u"]) == [30, 50]
+    assert store.get_cursor("u") == "50"
+    assert store.contains("u", "20")
+    store.close()